@@ -0,0 +1,49 @@
+import os
+from dataclasses import dataclass, field
+from functools import lru_cache
+from typing import Dict, FrozenSet
+
+# Agent name -> Azure agent ID used when no override is set in the environment
+DEFAULT_AGENT_IDS = {
+    "classifier": "asst_nCjO26kHQms2Zdpe7UGybmsB",
+    "information": "asst_qKo3BWukyXvfqOM5Eiu7jxl3",
+    "eligibility": "asst_nQej1R20aXi3n46pnuwuwdEy",
+    "eligibility_2": "asst_rgX5enEtCEHZYGUqSdE5YFOe",
+}
+
+# Optional agent setup steps:
+# - code_interpreter: attach docs/distances.csv to the eligibility agent's code interpreter
+# - function_tools: let agents call get_school_distances as a Python function tool
+# - semantic_cache: reuse classifier labels for questions worded differently to an earlier one
+#   (needs AZURE_EMBEDDINGS_DEPLOYMENT_NAME and EMBEDDINGS_OPENAI_API_VERSION)
+# - direct_classifier: classify with one chat completion instead of a classifier agent run
+FEATURES = frozenset({"code_interpreter", "function_tools", "semantic_cache", "direct_classifier"})
+DEFAULT_FEATURES = frozenset({"code_interpreter", "direct_classifier"})
+
+@dataclass(frozen=True)
+class AgentsConfig:
+    """Which Azure agents the chat handler talks to and which optional setup it performs"""
+    agents: Dict[str, str] = field(default_factory=lambda: dict(DEFAULT_AGENT_IDS))
+    features: FrozenSet[str] = DEFAULT_FEATURES
+
+    @classmethod
+    def from_env(cls) -> "AgentsConfig":
+        """Read agent IDs from AZURE_AGENT_<NAME>_ID and features from CHAT_FEATURES (comma separated)"""
+        agents = {
+            name: os.environ.get(f"AZURE_AGENT_{name.upper()}_ID", agent_id)
+            for name, agent_id in DEFAULT_AGENT_IDS.items()
+        }
+
+        features = DEFAULT_FEATURES
+        if "CHAT_FEATURES" in os.environ:
+            features = frozenset(f.strip() for f in os.environ["CHAT_FEATURES"].split(",") if f.strip())
+            unknown = features - FEATURES
+            if unknown:
+                raise ValueError(f"Unknown CHAT_FEATURES: {', '.join(sorted(unknown))}")
+
+        return cls(agents=agents, features=features)
+
+@lru_cache(maxsize=1)
+def load_agents_config() -> AgentsConfig:
+    """Return the process-wide agents config"""
+    return AgentsConfig.from_env()
@@ -0,0 +1,128 @@
+import os
+import asyncio
+from functools import lru_cache
+from typing import Dict
+
+import aiohttp
+from azure.core.pipeline.transport import AioHttpTransport
+from azure import identity
+from azure.identity.aio import AzureCliCredential, ChainedTokenCredential, EnvironmentCredential, ManagedIdentityCredential, get_bearer_token_provider
+from azure.ai.projects.aio import AIProjectClient
+
+from api.chat.distances import get_distance_client
+
+# Azure settings, read once at import (the apps load .env first). A missing endpoint is
+# reported by check_settings, so modules that never call Azure can import this one without it.
+AZURE_OPENAI_ENDPOINT = os.environ.get("AZURE_OPENAI_ENDPOINT", "")
+AZURE_OPENAI_DEPLOYMENT_NAME = os.environ.get("AZURE_OPENAI_DEPLOYMENT_NAME")
+AZURE_OPENAI_API_KEY_SET = "AZURE_OPENAI_API_KEY" in os.environ
+AZURE_EMBEDDINGS_DEPLOYMENT_NAME = os.environ.get("AZURE_EMBEDDINGS_DEPLOYMENT_NAME")
+EMBEDDINGS_OPENAI_API_VERSION = os.environ.get("EMBEDDINGS_OPENAI_API_VERSION")
+AZURE_PROJECT_ENDPOINT = AZURE_OPENAI_ENDPOINT.rstrip("/") + "/api/projects/councildemo"
+
+# Token scope for Azure OpenAI when no API key is configured
+COGNITIVE_SERVICES_SCOPE = "https://cognitiveservices.azure.com/.default"
+
+# Connections kept open to Azure, shared by every client in the process
+AZURE_CONNECTION_POOL_SIZE = 50
+AZURE_KEEPALIVE_TIMEOUT = 30
+
+# Agent ID -> agent, fetched once per process
+agents: Dict = {}
+agents_lock = asyncio.Lock()
+
+# Whether the function toolset has been registered with the shared client
+tools_registered = False
+
+def check_settings() -> None:
+    """Fail at startup, rather than on the first request, if the Azure endpoint isn't configured"""
+    if not AZURE_OPENAI_ENDPOINT:
+        raise ValueError("AZURE_OPENAI_ENDPOINT must be set to the Azure OpenAI resource endpoint")
+
+@lru_cache(maxsize=1)
+def get_credential() -> ChainedTokenCredential:
+    """Return the process-wide Azure credential"""
+    # Only the sources this app runs with: a service principal in the environment, managed
+    # identity on Azure, or az login locally. The chain reuses whichever succeeds first.
+    return ChainedTokenCredential(EnvironmentCredential(), ManagedIdentityCredential(), AzureCliCredential())
+
+@lru_cache(maxsize=1)
+def get_sync_credential() -> identity.ChainedTokenCredential:
+    """Return the process-wide credential for the OpenAI SDK's synchronous calls"""
+    return identity.ChainedTokenCredential(
+        identity.EnvironmentCredential(), identity.ManagedIdentityCredential(), identity.AzureCliCredential()
+    )
+
+def openai_auth() -> Dict:
+    """Keyword arguments authenticating the OpenAI SDK clients: the API key if set, otherwise the shared credentials"""
+    if AZURE_OPENAI_API_KEY_SET:
+        return {}
+    # The sync provider covers invoke() and embed_query(), the async one their a- variants
+    return {
+        "azure_ad_token_provider": identity.get_bearer_token_provider(get_sync_credential(), COGNITIVE_SERVICES_SCOPE),
+        "azure_ad_async_token_provider": get_bearer_token_provider(get_credential(), COGNITIVE_SERVICES_SCOPE),
+    }
+
+@lru_cache(maxsize=1)
+def get_transport() -> AioHttpTransport:
+    """Return the process-wide pooled, keep-alive transport for the Azure SDK clients"""
+    # The session is closed by close_clients, not by whichever client happens to close first
+    session = aiohttp.ClientSession(connector=aiohttp.TCPConnector(
+        limit=AZURE_CONNECTION_POOL_SIZE, keepalive_timeout=AZURE_KEEPALIVE_TIMEOUT
+    ))
+    return AioHttpTransport(session=session, session_owner=False)
+
+@lru_cache(maxsize=1)
+def get_http_client():
+    """Return the process-wide pooled HTTP client for the OpenAI SDK"""
+    import httpx
+
+    return httpx.AsyncClient(limits=httpx.Limits(
+        max_connections=AZURE_CONNECTION_POOL_SIZE, keepalive_expiry=AZURE_KEEPALIVE_TIMEOUT
+    ))
+
+@lru_cache(maxsize=1)
+def get_project() -> AIProjectClient:
+    """Return the process-wide Azure AI Project client"""
+    # The agents client is built with the same keyword arguments, so it shares the transport
+    return AIProjectClient(
+        credential=get_credential(),
+        endpoint=AZURE_PROJECT_ENDPOINT,
+        transport=get_transport()
+    )
+
+async def get_agents(agent_ids: Dict[str, str]) -> Dict:
+    """Return agents by name, fetching any not already cached for this process"""
+    async with agents_lock:
+        missing = [agent_id for agent_id in agent_ids.values() if agent_id not in agents]
+        if missing:
+            project = get_project()
+            fetched = await asyncio.gather(*(project.agents.get_agent(agent_id) for agent_id in missing))
+            agents.update(zip(missing, fetched))
+    return {name: agents[agent_id] for name, agent_id in agent_ids.items()}
+
+async def close_clients() -> None:
+    """Close the shared Azure clients"""
+    if get_project.cache_info().currsize:
+        await get_project().close()
+    if get_credential.cache_info().currsize:
+        await get_credential().close()
+    if get_sync_credential.cache_info().currsize:
+        get_sync_credential().close()
+    if get_transport.cache_info().currsize:
+        await get_transport().session.close()
+    if get_http_client.cache_info().currsize:
+        await get_http_client().aclose()
+    if get_distance_client.cache_info().currsize:
+        await get_distance_client().aclose()
+    get_project.cache_clear()
+    get_credential.cache_clear()
+    get_sync_credential.cache_clear()
+    get_transport.cache_clear()
+    get_http_client.cache_clear()
+    get_distance_client.cache_clear()
+    agents.clear()
+
+    # A new client needs its toolset registered again
+    global tools_registered
+    tools_registered = False
@@ -1,174 +1,722 @@
-import os
-import json
-import time
-from typing import Dict
-
-from fastapi import FastAPI
-from pydantic import BaseModel
-
-from azure.identity import DefaultAzureCredential
-from azure.ai.projects import AIProjectClient
-from azure.ai.agents.models import ListSortOrder, FunctionTool, ToolSet, CodeInterpreterTool, FilePurpose, MessageRole
-from langchain_openai import AzureChatOpenAI
-
-class ChatHandler:
-    def __init__(self) -> None:
-        # Initialize LLM
-        self.llm = AzureChatOpenAI(
-            azure_deployment=os.environ["AZURE_OPENAI_DEPLOYMENT_NAME"]
+import logging
+import asyncio
+import inspect
+from collections import deque
+from dataclasses import dataclass, field
+from functools import cached_property
+from typing import AsyncIterator, Optional, Tuple
+
+import orjson
+from azure.core.exceptions import ResourceNotFoundError
+from azure.ai.projects.aio import AIProjectClient
+from azure.ai.agents.models import ListSortOrder, AsyncFunctionTool, AsyncToolSet, CodeInterpreterTool, FilePurpose, MessageRole, MessageDeltaChunk, SubmitToolOutputsAction, ThreadMessageOptions, ThreadRun, ToolOutput
+
+from api.chat import azure_clients
+from api.chat.agents_config import AgentsConfig, load_agents_config
+from api.chat.azure_clients import (
+    AZURE_EMBEDDINGS_DEPLOYMENT_NAME, AZURE_OPENAI_DEPLOYMENT_NAME, AZURE_OPENAI_ENDPOINT, EMBEDDINGS_OPENAI_API_VERSION,
+    agents, check_settings, get_agents, get_http_client, get_project, openai_auth
+)
+from api.chat.classifier import (
+    CLASSIFIER_CACHE_SIZE, CLASSIFIER_HISTORY_TURNS, CLASSIFIER_LABELS, CLASSIFIER_VERSION,
+    classifier_cache, record_classification_source, rule_based_classify, semantic_cache_lookup, semantic_cache_store,
+    unit_embedding
+)
+from api.chat.distances import (
+    DISTANCE_API_ENDPOINT, DISTANCES_FILE_PATH, distances_lock, distances_path, distances_ready, file_sha256,
+    get_distance_client, load_distances_state, no_schools_reply, normalise_postcode, save_distances_state,
+    school_distances_json
+)
+from api.chat.response_cache import information_cache
+
+logger = logging.getLogger(__name__)
+
+# Caps the number of agent runs in flight at once to stay within Azure rate limits
+AZURE_CONCURRENCY_LIMIT = 8
+
+# Run status checks start quickly and back off, doubling up to the max interval
+RUN_POLL_INITIAL_INTERVAL = 0.05
+RUN_POLL_MAX_INTERVAL = 0.5
+
+def poll_delay(attempt: int) -> float:
+    """Seconds to wait before re-checking a run that has been polled attempt times"""
+    return min(RUN_POLL_MAX_INTERVAL, RUN_POLL_INITIAL_INTERVAL * 2 ** attempt)
+
+# Longest a single agent run may take before it is cancelled
+RUN_TIMEOUT = 30.0
+
+# Output caps per run; a run that hits its cap ends as "incomplete" with the text so far
+CLASSIFIER_MAX_COMPLETION_TOKENS = 8
+RESPONSE_MAX_COMPLETION_TOKENS = 500
+
+azure_semaphore = asyncio.Semaphore(AZURE_CONCURRENCY_LIMIT)
+
+INFORMATION_FALLBACK = "Sorry, I couldn’t provide information at this time."
+ELIGIBILITY_FALLBACK = "Sorry, I couldn’t generate an eligibility response."
+
+# Anything the classifier doesn't route to eligibility is answered by the information agent
+INFORMATION_QUERY_TYPES = ("Information_Request", "General_Greeting")
+
+# Only run the information agent speculatively while most recent queries end up there
+SPECULATION_WINDOW = 50
+SPECULATION_MIN_HIT_RATE = 0.5
+
+# Recent messages a speculative answer sees, copied from the session so no thread read is needed
+FORK_HISTORY_LIMIT = 20
+
+# Recent messages the classifier sees as conversation context
+CLASSIFIER_HISTORY_LIMIT = CLASSIFIER_HISTORY_TURNS * 2
+
+# Whether each recent query was routed to the information agent
+recent_information_hits: deque = deque(maxlen=SPECULATION_WINDOW)
+
+# Keeps references to fire-and-forget clean-up tasks so they aren't garbage collected
+background_tasks = set()
+
+def run_in_background(coro) -> None:
+    task = asyncio.create_task(coro)
+    background_tasks.add(task)
+    task.add_done_callback(background_tasks.discard)
+
+class RunShortCircuited(Exception):
+    """Raised after cancelling a run whose reply was already decided by its tool results"""
+
+    def __init__(self, run, reply: str) -> None:
+        super().__init__(reply)
+        self.run = run
+        self.reply = reply
+
+@dataclass
+class Session:
+    """One user's conversation state, kept off the handler so a single handler can serve every user"""
+    # Created on first use, so sessions that never send a message cost no Azure calls
+    thread_id: Optional[str] = None
+    last_query_type: Optional[str] = None
+    turn_count: int = 0
+
+    # Posted by the run that answers the current turn
+    pending_user_message: Optional[str] = None
+
+    # Recent ("human" | "ai", text) messages, so classifying and speculating needn't read the thread
+    history: deque = field(default_factory=lambda: deque(maxlen=FORK_HISTORY_LIMIT), repr=False)
+
+    # Azure allows one active run per thread, so a session's turns run one at a time
+    lock: asyncio.Lock = field(default_factory=asyncio.Lock, repr=False)
+
+@dataclass
+class StreamedReply:
+    """A streamed run's reply so far, filled in while its events are read"""
+    chunks: list = field(default_factory=list)
+
+    # The latest run event, whose status is "completed" once thread.run.completed has arrived
+    run: Optional[ThreadRun] = None
+
+    @property
+    def status(self) -> Optional[str]:
+        return self.run.status if self.run is not None else None
+
+class AsyncChatHandler:
+    def __init__(self, config: Optional[AgentsConfig] = None) -> None:
+        self.config = config or load_agents_config()
+
+        # Python functions the agents can call, by tool name
+        self.tool_functions = {
+            "get_school_distances": self.get_school_distances,
+        }
+
+    @property
+    def project(self) -> AIProjectClient:
+        """Shared Azure AI Project client, built inside the event loop on first use"""
+        return get_project()
+
+    @cached_property
+    def llm(self):
+        """Chat model for direct completions, built on first use since the agents don't need it"""
+        from langchain_openai import AzureChatOpenAI
+
+        return AzureChatOpenAI(
+            azure_deployment=AZURE_OPENAI_DEPLOYMENT_NAME,
+            http_async_client=get_http_client(),
+            **openai_auth()
         )
 
-        # Initialize Azure AI Project client
-        self.project = AIProjectClient(
-            credential=DefaultAzureCredential(),
-            endpoint=os.environ["AZURE_OPENAI_ENDPOINT"] + "api/projects/councildemo"
+    @cached_property
+    def embeddings(self):
+        """Embedding model for the semantic classifier cache, built on first use"""
+        from langchain_openai import AzureOpenAIEmbeddings
+
+        return AzureOpenAIEmbeddings(
+            azure_deployment=AZURE_EMBEDDINGS_DEPLOYMENT_NAME,
+            openai_api_version=EMBEDDINGS_OPENAI_API_VERSION,
+            azure_endpoint=AZURE_OPENAI_ENDPOINT,
+            http_async_client=get_http_client(),
+            **openai_auth()
         )
 
-        # Initialize agents
-        self.agent_classifier = self.project.agents.get_agent("asst_nCjO26kHQms2Zdpe7UGybmsB")
-        self.agent_information = self.project.agents.get_agent("asst_qKo3BWukyXvfqOM5Eiu7jxl3")
-        self.agent_eligibility = self.project.agents.get_agent("asst_nQej1R20aXi3n46pnuwuwdEy")
+    @cached_property
+    def classifier_chain(self):
+        """Single chat completion that labels the latest message given the recent history"""
+        from langchain_core.messages import SystemMessage
+        from langchain_core.output_parsers import StrOutputParser
+        from langchain_core.prompts import ChatPromptTemplate, MessagesPlaceholder
+
+        # The classifier agent's own instructions, so the two classifiers can't drift apart. Passed
+        # as a message rather than a template so braces in the instructions aren't read as variables.
+        prompt = ChatPromptTemplate.from_messages([
+            SystemMessage(content=self.agent_classifier.instructions),
+            MessagesPlaceholder("history"),
+            ("human", "{question}"),
+        ])
+        llm = self.llm.bind(max_tokens=CLASSIFIER_MAX_COMPLETION_TOKENS, temperature=0)
+        return prompt | llm | StrOutputParser()
+
+    async def prepare(self) -> None:
+        """Look up the shared agents and run the one-off agent setup"""
+        check_settings()
+
+        # Agents are fetched once per process
+        handler_agents = await get_agents(self.config.agents)
+        self.agent_classifier = handler_agents["classifier"]
+        self.agent_information = handler_agents["information"]
+        self.agent_eligibility = handler_agents["eligibility"]
+
+        self.agent_eligibility_2 = handler_agents["eligibility_2"]
 
-        self.agent_eligibility_2 = self.project.agents.get_agent("asst_rgX5enEtCEHZYGUqSdE5YFOe")
+        # Setup tools/functions for automatic function calling
+        if "function_tools" in self.config.features:
+            self._ensure_tools_registered()
 
-        # Create conversation thread
-        self.thread = self.project.agents.threads.create()
+        if "code_interpreter" in self.config.features:
+            await self.setup_agent_with_querying()
 
-        # Setup tools/functions for automatic function calling
-        #self.setup_agents_with_tools()
+    def new_session(self) -> Session:
+        """Start a conversation; its thread is created with the first message"""
+        return Session()
 
-        self.setup_agent_with_querying()
+    def _ensure_tools_registered(self) -> None:
+        """Register the function toolset once per process rather than on every prepare()"""
+        # No awaits between the check and the set, so concurrent prepare() calls can't both register
+        if azure_clients.tools_registered:
+            return
+        self.setup_agents_with_tools()
+        azure_clients.tools_registered = True
 
     def setup_agents_with_tools(self):
         """Register Python functions as tools for the eligibility agent"""
 
         # Wrap the Python function in FunctionTool
-        school_distance_tool = FunctionTool(functions=[self.get_school_distances])
+        school_distance_tool = AsyncFunctionTool(functions=[self.get_school_distances])
 
         # Use ToolSet to allow multiple tools
-        toolset = ToolSet()
+        toolset = AsyncToolSet()
         toolset.add(school_distance_tool)
 
         # Enable auto function calls for the eligibility agent
         self.project.agents.enable_auto_function_calls(toolset)
 
-    def setup_agent_with_querying(self):
+    async def setup_agent_with_querying(self):
+        """Attach docs/distances.csv to the eligibility agent's code interpreter, once per process"""
+        async with distances_lock:
+            agent_id = self.agent_eligibility_2.id
+            if agent_id in distances_ready:
+                self.agent_eligibility_2 = agents[agent_id]
+                return
+
+            # Rewriting the agent's tools changes the prompt prefix Azure caches for it,
+            # so only upload when distances.csv has changed since the attached copy
+            sha256 = await asyncio.to_thread(file_sha256, DISTANCES_FILE_PATH)
+            state = load_distances_state()
+            resources = self.agent_eligibility_2.tool_resources
+            attached = resources.code_interpreter.file_ids if resources and resources.code_interpreter else []
+            if state.get("sha256") == sha256 and state.get("file_id") in attached:
+                logger.info("Eligibility agent already has distances file: %s", state["file_id"])
+                distances_ready.add(agent_id)
+                return
+
+            file = await self.project.agents.files.upload_and_poll(file_path=DISTANCES_FILE_PATH, purpose=FilePurpose.AGENTS)
+
+            logger.info("Uploaded file, file ID: %s", file.id)
+
+            code_interpreter = CodeInterpreterTool(file_ids=[file.id])
+
+            self.agent_eligibility_2 = await self.project.agents.update_agent(
+                agent_id = agent_id,
+                tools=code_interpreter.definitions,
+                tool_resources=code_interpreter.resources,
+            )
+            agents[agent_id] = self.agent_eligibility_2
+            save_distances_state(sha256, file.id)
+            distances_ready.add(agent_id)
+
+    async def get_school_distances(self, postcode: str) -> str:
+        """Return eligible schools for transport based on postcode"""
 
-        asset_file_path = os.path.abspath(
-            os.path.join(os.path.dirname(__file__), "../../docs/distances.csv")
-        )
+        logger.debug("get_school_distances called with postcode: %s", postcode)
 
-        file = self.project.agents.files.upload_and_poll(file_path=asset_file_path, purpose=FilePurpose.AGENTS)
+        postcode = normalise_postcode(postcode)
 
-        print(f"Uploaded file, file ID: {file.id}")
+        if not DISTANCE_API_ENDPOINT:
+            return school_distances_json(postcode)
 
-        code_interpreter = CodeInterpreterTool(file_ids=[file.id])
+        try:
+            response = await get_distance_client().get(distances_path(postcode))
+            response.raise_for_status()
+        except Exception as ex:
+            logger.warning("Distance lookup for %s failed: %s", postcode, ex)
+            return orjson.dumps({"postcode": postcode, "error": "Distance lookup failed"}).decode()
+        return response.text
 
-        file = self.project.agents.update_agent(
-            agent_id = self.agent_eligibility_2.id,
-            tools=code_interpreter.definitions,
-            tool_resources=code_interpreter.resources,
+    async def _dispatch_tool(self, tool_call) -> ToolOutput:
+        """Run a single function tool call, in a worker thread unless it is a coroutine"""
+        function = self.tool_functions.get(tool_call.function.name)
+        if function is None:
+            output = orjson.dumps({"error": f"Unknown function: {tool_call.function.name}"}).decode()
+        else:
+            try:
+                arguments = orjson.loads(tool_call.function.arguments or "{}")
+                if inspect.iscoroutinefunction(function):
+                    output = await function(**arguments)
+                else:
+                    output = await asyncio.to_thread(function, **arguments)
+            except Exception as ex:
+                # Report the failure to the agent rather than failing the other calls gathered with it
+                logger.warning("Tool call %s failed: %s", tool_call.function.name, ex)
+                output = orjson.dumps({"error": f"{tool_call.function.name} failed"}).decode()
+        return ToolOutput(tool_call_id=tool_call.id, output=output)
+
+    async def _submit_tool_outputs(self, thread_id: str, run):
+        """Execute every tool call the run is waiting on concurrently and submit the results"""
+        tool_calls = run.required_action.submit_tool_outputs.tool_calls
+        tool_outputs = await asyncio.gather(*(self._dispatch_tool(tool_call) for tool_call in tool_calls))
+
+        # No schools in range settles the check, so skip the agent's turn spelling that out
+        reply = no_schools_reply(tool_calls, tool_outputs)
+        if reply is not None:
+            run = await self._cancel_run(thread_id, run)
+            raise RunShortCircuited(run, reply)
+
+        return await self.project.agents.runs.submit_tool_outputs(
+            thread_id=thread_id, run_id=run.id, tool_outputs=list(tool_outputs)
         )
 
-    def get_school_distances(self, postcode: str) -> str:
-        """Return eligible schools for transport based on postcode"""
-
-        print(f"[DEBUG] get_school_distances called with postcode: {postcode}")
-
-        # Simulated responses
-        if postcode.startswith("E"):
-            result = {
-                "postcode": postcode,
-                "valid_schools_for_transport": ["East London High School", "St Peter's School"],
-                "total_schools_found": 2,
-                "important_note": "These are the ONLY schools within transport range."
-            }
-        elif postcode.startswith("SW"):
-            result = {
-                "postcode": postcode,
-                "valid_schools_for_transport": ["West London High School", "St Paul's School"],
-                "total_schools_found": 2,
-                "important_note": "These are the ONLY schools within transport range."
-            }
+    async def _cancel_run(self, thread_id: str, run):
+        """Cancel a run and wait until it has stopped, so the thread accepts new messages"""
+        run = await self.project.agents.runs.cancel(thread_id=thread_id, run_id=run.id)
+        attempt = 0
+        while run.status in ("cancelling", "in_progress", "queued", "requires_action"):
+            await asyncio.sleep(poll_delay(attempt))
+            attempt += 1
+            run = await self.project.agents.runs.get(thread_id=thread_id, run_id=run.id)
+        return run
+
+    async def _try_cancel_run(self, thread_id: str, run_id: str) -> None:
+        """Cancel a run without waiting for it to stop, logging rather than raising if Azure refuses"""
+        try:
+            await self.project.agents.runs.cancel(thread_id=thread_id, run_id=run_id)
+        except Exception as ex:
+            # Most often the run finished between the last status check and the cancel
+            logger.warning("Cancelling run %s failed: %s", run_id, ex)
+
+    async def _on_thread(self, session: Session, operation, **kwargs):
+        """Call an SDK operation on the session's thread, starting a new thread if there is none yet or Azure has dropped it"""
+        if session.thread_id is None:
+            session.thread_id = (await self.project.agents.threads.create()).id
+        try:
+            return await operation(thread_id=session.thread_id, **kwargs)
+        except ResourceNotFoundError as ex:
+            if "No thread found" not in str(ex):
+                raise
+            logger.info("Thread %s no longer exists, starting a new one", session.thread_id)
+            session.thread_id = (await self.project.agents.threads.create()).id
+            session.last_query_type = None
+            session.turn_count = 0
+            session.history.clear()
+            return await operation(thread_id=session.thread_id, **kwargs)
+
+    def _take_user_message(self, session: Session) -> Optional[list]:
+        """Hand the pending user message to the next run as additional_messages"""
+        if session.pending_user_message is None:
+            return None
+        messages = [ThreadMessageOptions(role=MessageRole.USER, content=session.pending_user_message)]
+        session.pending_user_message = None
+        return messages
+
+    async def _post_exchange(self, session: Session, input_text: str, response: str) -> None:
+        """Add a user message and a reply produced off the thread to the session's thread"""
+        session.pending_user_message = None
+        if session.thread_id is None:
+            # A first turn starts its thread with both messages in one call
+            thread = await self.project.agents.threads.create(messages=[
+                ThreadMessageOptions(role=MessageRole.USER, content=input_text),
+                ThreadMessageOptions(role=MessageRole.AGENT, content=response),
+            ])
+            session.thread_id = thread.id
+            return
+
+        await self._on_thread(session, self.project.agents.messages.create, role=MessageRole.USER, content=input_text)
+        await self._on_thread(session, self.project.agents.messages.create, role=MessageRole.AGENT, content=response)
+
+    async def _run_with_timeout(
+        self, agent_id: str, session: Optional[Session] = None, thread_id: Optional[str] = None,
+        timeout: float = RUN_TIMEOUT, **run_options
+    ):
+        """Start a run and poll it to completion, cancelling it if it takes longer than timeout"""
+        # Runs on the session's thread, or on a scratch thread given by thread_id
+        if session is not None:
+            run = await self._on_thread(session, self.project.agents.runs.create, agent_id=agent_id, **run_options)
         else:
-            result = {
-                "postcode": postcode,
-                "valid_schools_for_transport": [],
-                "total_schools_found": 0,
-                "important_note": "No schools are within transport range for this postcode."
-            }
-
-        return json.dumps(result)
+            run = await self.project.agents.runs.create(thread_id=thread_id, agent_id=agent_id, **run_options)
+        thread_id = run.thread_id
+
+        async def poll(run):
+            # Wait until the run is complete, answering any tool calls along the way
+            attempt = 0
+            while run.status in ("in_progress", "queued", "requires_action"):
+                if run.status == "requires_action" and isinstance(run.required_action, SubmitToolOutputsAction):
+                    run = await self._submit_tool_outputs(thread_id, run)
+                    # The run picks back up straight after the tool outputs, so poll quickly again
+                    attempt = 0
+                    continue
+                await asyncio.sleep(poll_delay(attempt))
+                attempt += 1
+                run = await self.project.agents.runs.get(thread_id=thread_id, run_id=run.id)
+            return run
+
+        try:
+            run = await asyncio.wait_for(poll(run), timeout=timeout)
+        except asyncio.TimeoutError:
+            # Free the thread so the next message can be added to it
+            await self._try_cancel_run(thread_id, run.id)
+            raise TimeoutError(f"Agent run {run.id} did not complete within {timeout} seconds")
+        except asyncio.CancelledError:
+            # A discarded speculative run would otherwise keep generating on Azure
+            run_in_background(self._try_cancel_run(thread_id, run.id))
+            raise
+
+        if run.status == "failed":
+            logger.warning("Run %s failed: %s", run.id, run.last_error)
+        return run
+
+    async def _last_agent_text(self, run, default: str) -> str:
+        """Return the text of the reply the run added to its thread"""
+        # Fetch only the run's newest message. A run that ended without replying returns
+        # nothing, rather than an earlier turn's reply or a page walk back through the thread.
+        async for msg in self.project.agents.messages.list(
+            thread_id=run.thread_id, run_id=run.id, order=ListSortOrder.DESCENDING, limit=1
+        ):
+            if msg.role == MessageRole.AGENT and msg.text_messages:
+                return msg.text_messages[-1].text.value
+            break
+        return default
+
+    async def cached_information_response(self, session: Session, input_text: str) -> Optional[str]:
+        """Answer an opening question from the response cache, recording it on the thread"""
+        # Later turns depend on the conversation so far, so only opening questions are cached
+        if session.turn_count > 0:
+            return None
+
+        cached = await information_cache.get(input_text)
+        if cached is None:
+            return None
+
+        label, response = cached
+        logger.debug("Information cache hit: %s", label)
+        await self._post_exchange(session, input_text, response)
+        session.last_query_type = label
+        session.turn_count += 1
+        self.record_turn(session, input_text, response)
+        return response
 
-    def classify_query(self, input_text: str) -> str:
+    def record_turn(self, session: Session, input_text: str, response: str) -> None:
+        """Keep the exchange as context for classifying the session's next message"""
+        session.history.append(("human", input_text))
+        session.history.append(("ai", response))
+
+    async def remember_information_response(
+        self, input_text: str, label: str, response: str, status: Optional[str], first_turn: bool
+    ) -> None:
+        """Store an information agent answer to an opening question"""
+        # Failed, cancelled and token-capped runs can leave a partial reply, which mustn't be replayed
+        if (
+            first_turn and label in INFORMATION_QUERY_TYPES and status == "completed"
+            and response and response != INFORMATION_FALLBACK
+        ):
+            await information_cache.set(input_text, label, response)
+
+    def _recent_history(self, session: Session, limit: int) -> list:
+        """The session's last limit messages, oldest first"""
+        return list(session.history)[-limit:]
+
+    def _history_messages(self, session: Session, input_text: str, limit: int) -> list:
+        """The session's last limit messages and the latest message, for seeding a scratch thread"""
+        messages = [
+            ThreadMessageOptions(role=MessageRole.USER if role == "human" else MessageRole.AGENT, content=text)
+            for role, text in self._recent_history(session, limit)
+        ]
+        messages.append(ThreadMessageOptions(role=MessageRole.USER, content=input_text))
+        return messages
+
+    def _classifier_cache_key(self, session: Session, input_text: str) -> tuple:
+        # The label depends on where the conversation is, so key on the previous label too
+        return (CLASSIFIER_VERSION, session.last_query_type, input_text.lower().strip())
+
+    def quick_classify(self, session: Session, input_text: str) -> Optional[str]:
+        """Classify from the rules or the label cache without calling Azure, or return None"""
+        label = rule_based_classify(input_text, session.last_query_type)
+        if label is not None:
+            record_classification_source("rule")
+            session.last_query_type = label
+            return label
+
+        cache_key = self._classifier_cache_key(session, input_text)
+        cached_label = classifier_cache.get(cache_key)
+        if cached_label is not None:
+            classifier_cache.move_to_end(cache_key)
+            logger.debug("Classifier cache hit: %s", cached_label)
+            record_classification_source("cache")
+            session.last_query_type = cached_label
+            return cached_label
+
+        return None
+
+    async def classify_query(self, session: Session, input_text: str) -> str:
         """Classify the query type"""
-        message = self.project.agents.messages.create(
-            thread_id=self.thread.id, role="user", content=input_text
-        )
-
-        run = self.project.agents.runs.create_and_process(
-            thread_id=self.thread.id, agent_id=self.agent_classifier.id
-        )
-
-        # Fetch last agent message
-        messages = self.project.agents.messages.list(
-            thread_id=self.thread.id, order=ListSortOrder.ASCENDING
-        )
-        last_message = next(
-            (msg.text_messages[-1].text.value for msg in list(messages)[::-1] if msg.text_messages),
-            "Unknown"
-        )
-
-        print(f"[DEBUG] Classifier full output: {last_message}")
-        return last_message.strip()
-
-    def handle_information_request(self, input_text: str) -> str:
-        """Handle general information queries"""
-        run = self.project.agents.runs.create_and_process(
-            thread_id=self.thread.id, agent_id=self.agent_information.id
+        label = self.quick_classify(session, input_text)
+        if label is not None:
+            return label
+
+        cache_key = self._classifier_cache_key(session, input_text)
+
+        # An embedding call is much quicker than a classifier run, so try a similar earlier question first
+        embedding = None
+        if "semantic_cache" in self.config.features:
+            try:
+                embedding = unit_embedding(await self.embeddings.aembed_query(cache_key[2]))
+            except Exception as ex:
+                logger.warning("Embedding for the semantic classifier cache failed: %s", ex)
+            if embedding is not None:
+                label = semantic_cache_lookup(cache_key, embedding)
+                if label is not None:
+                    logger.debug("Semantic classifier cache hit: %s", label)
+                    record_classification_source("semantic")
+                    session.last_query_type = label
+                    return label
+
+        if "direct_classifier" in self.config.features:
+            # One chat completion instead of posting a message, starting a run, polling and reading it back
+            try:
+                last_message = await asyncio.wait_for(
+                    self.classifier_chain.ainvoke({
+                        "history": self._recent_history(session, CLASSIFIER_HISTORY_LIMIT), "question": input_text
+                    }),
+                    timeout=RUN_TIMEOUT
+                )
+            except asyncio.TimeoutError:
+                raise TimeoutError(f"Classifier did not respond within {RUN_TIMEOUT} seconds")
+        else:
+            # A scratch thread keeps the label out of the conversation the answering agents read
+            scratch = await self.project.agents.threads.create(
+                messages=self._history_messages(session, input_text, CLASSIFIER_HISTORY_LIMIT)
+            )
+            try:
+                # Deterministic, label-sized output
+                run = await self._run_with_timeout(
+                    self.agent_classifier.id, thread_id=scratch.id,
+                    max_completion_tokens=CLASSIFIER_MAX_COMPLETION_TOKENS, temperature=0
+                )
+                last_message = await self._last_agent_text(run, "Unknown")
+            finally:
+                run_in_background(self.project.agents.threads.delete(scratch.id))
+
+        logger.debug("Classifier full output: %s", last_message)
+        label = last_message.strip()
+        record_classification_source("agent")
+
+        if label in CLASSIFIER_LABELS:
+            classifier_cache[cache_key] = label
+            if len(classifier_cache) > CLASSIFIER_CACHE_SIZE:
+                classifier_cache.popitem(last=False)
+            if embedding is not None:
+                semantic_cache_store(cache_key, embedding, label)
+
+        session.last_query_type = label
+        return label
+
+    async def handle_information_request(self, session: Session, input_text: str) -> Tuple[str, str]:
+        """Handle general information queries, returning the reply and the run's final status"""
+        run = await self._run_with_timeout(
+            self.agent_information.id, session, additional_messages=self._take_user_message(session),
+            max_completion_tokens=RESPONSE_MAX_COMPLETION_TOKENS
         )
 
-        messages = self.project.agents.messages.list(
-            thread_id=self.thread.id, order=ListSortOrder.ASCENDING
-        )
-        response = next(
-            (msg.text_messages[-1].text.value for msg in list(messages)[::-1] if msg.text_messages),
-            "Sorry, I couldn’t provide information at this time."
-        )
+        response = await self._last_agent_text(run, INFORMATION_FALLBACK)
 
-        print(f"[DEBUG] Information Agent response: {response}")
-        return response
+        logger.debug("Information Agent response: %s", response)
+        return response, run.status
 
-    def conduct_eligibility_assessment(self, input_text: str) -> str:
+    async def conduct_eligibility_assessment(self, session: Session, input_text: str) -> str:
         """Handle eligibility assessment via auto function calls"""
-        run = self.project.agents.runs.create_and_process(
-            thread_id=self.thread.id,
-            agent_id=self.agent_eligibility_2.id
-        )
-
-        # Wait until the run is complete
-        while run.status in ("in_progress", "queued"):
-            time.sleep(1)
-            run = self.project.agents.runs.get(thread_id=self.thread.id, run_id=run.id)
-
-        messages = self.project.agents.messages.list(
-            thread_id=self.thread.id, order=ListSortOrder.ASCENDING
-        )
-        response = next(
-            (msg.text_messages[-1].text.value for msg in list(messages)[::-1] if msg.text_messages),
-            "Sorry, I couldn’t generate an eligibility response."
-        )
+        try:
+            run = await self._run_with_timeout(
+                self.agent_eligibility_2.id, session, additional_messages=self._take_user_message(session),
+                max_completion_tokens=RESPONSE_MAX_COMPLETION_TOKENS
+            )
+        except RunShortCircuited as ex:
+            # The cancelled run added no reply, so record the decision on the thread
+            await self._on_thread(session, self.project.agents.messages.create, role=MessageRole.AGENT, content=ex.reply)
+            return ex.reply
+
+        response = await self._last_agent_text(run, ELIGIBILITY_FALLBACK)
         return response
 
-    def get_chat_response(self, input_text: str) -> str:
+    async def speculate_information_request(self, messages: list) -> Tuple[str, str]:
+        """Answer the latest message on a scratch thread holding messages, returning the reply and the run's final status"""
+        fork = await self.project.agents.threads.create(messages=messages)
+        try:
+            run = await self._run_with_timeout(
+                self.agent_information.id, thread_id=fork.id, max_completion_tokens=RESPONSE_MAX_COMPLETION_TOKENS
+            )
+            return await self._last_agent_text(run, INFORMATION_FALLBACK), run.status
+        finally:
+            run_in_background(self.project.agents.threads.delete(fork.id))
+
+    def should_speculate(self) -> bool:
+        """Speculate while the information agent is the likely destination"""
+        if not recent_information_hits:
+            return True
+        return sum(recent_information_hits) / len(recent_information_hits) > SPECULATION_MIN_HIT_RATE
+
+    async def stream_agent_response(
+        self, session: Session, agent_id: str, reply: StreamedReply, timeout: float = RUN_TIMEOUT
+    ) -> AsyncIterator[str]:
+        """Yield the agent's reply text as it is generated, cancelling the run if it takes longer than timeout"""
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+
+        # Starting the run takes a concurrency slot; reading its events is paced by the client, so doesn't
+        async with azure_semaphore:
+            try:
+                stream = await asyncio.wait_for(self._on_thread(
+                    session, self.project.agents.runs.stream, agent_id=agent_id,
+                    additional_messages=self._take_user_message(session), max_completion_tokens=RESPONSE_MAX_COMPLETION_TOKENS
+                ), timeout=timeout)
+            except asyncio.TimeoutError:
+                raise TimeoutError(f"Agent run did not start within {timeout} seconds")
+
+        async with stream:
+            events = stream.__aiter__()
+            try:
+                while True:
+                    try:
+                        event_type, event_data, _ = await asyncio.wait_for(events.__anext__(), deadline - loop.time())
+                    except StopAsyncIteration:
+                        break
+                    if isinstance(event_data, ThreadRun):
+                        reply.run = event_data
+                    elif isinstance(event_data, MessageDeltaChunk):
+                        reply.chunks.append(event_data.text)
+                        yield event_data.text
+            except asyncio.TimeoutError:
+                # Free the thread so the next message can be added to it
+                if reply.run is not None:
+                    await self._try_cancel_run(reply.run.thread_id, reply.run.id)
+                raise TimeoutError(f"Agent run did not complete within {timeout} seconds")
+            except (asyncio.CancelledError, GeneratorExit):
+                # The client went away mid-reply, so stop the run generating for no one
+                if reply.run is not None:
+                    run_in_background(self._try_cancel_run(reply.run.thread_id, reply.run.id))
+                raise
+
+    async def stream_chat_response(self, session: Session, input_text: str) -> AsyncIterator[str]:
+        """Route the query and stream the information agent's reply, or send the eligibility decision whole"""
+        async with session.lock:
+            # Only the Azure calls hold a concurrency slot, not the yields a slow client can stall
+            async with azure_semaphore:
+                cached = await self.cached_information_response(session, input_text)
+            if cached is not None:
+                yield cached
+                return
+
+            first_turn = session.turn_count == 0
+            session.turn_count += 1
+
+            # Posted by the run that answers it
+            session.pending_user_message = input_text
+
+            # The classifier output is a short label, so routing is not streamed
+            async with azure_semaphore:
+                query_type = await self.classify_query(session, input_text)
+            logger.debug("Classified query type: %s", query_type)
+
+            if query_type == "Eligibility_Check":
+                # The eligibility run stops for its tool calls, which the stream can't answer, so run it to completion
+                async with azure_semaphore:
+                    response = await self.conduct_eligibility_assessment(session, input_text)
+                yield response
+                self.record_turn(session, input_text, response)
+                return
+
+            reply = StreamedReply()
+            async for chunk in self.stream_agent_response(session, self.agent_information.id, reply):
+                yield chunk
+
+            response = "".join(reply.chunks)
+            if not response:
+                # The run ended without replying, so say so rather than leave the client with nothing
+                response = INFORMATION_FALLBACK
+                yield response
+            self.record_turn(session, input_text, response)
+            await self.remember_information_response(input_text, query_type, response, reply.status, first_turn)
+
+    async def aget_chat_response(self, session: Session, input_text: str) -> str:
         """Main entry point to route queries"""
-        query_type = self.classify_query(input_text)
-        print(f"[DEBUG] Classified query type: {query_type}")
-
-        if query_type in ["Information_Request", "General_Greeting"]:
-            return self.handle_information_request(input_text)
-        elif query_type == "Eligibility_Check":
-            return self.conduct_eligibility_assessment(input_text)
-        else:
-            # Default fallback
-            return self.handle_information_request(input_text)
\ No newline at end of file
+        async with session.lock, azure_semaphore:
+            cached = await self.cached_information_response(session, input_text)
+            if cached is not None:
+                return cached
+
+            first_turn = session.turn_count == 0
+            session.turn_count += 1
+
+            # Posted by the run that answers it
+            session.pending_user_message = input_text
+
+            speculative = None
+            query_type = self.quick_classify(session, input_text)
+            if query_type is None:
+                # Start the likely information answer while the classifier decides
+                if self.should_speculate():
+                    # Seeded from the session's own history, so starting it costs no thread read
+                    speculative = asyncio.create_task(
+                        self.speculate_information_request(self._history_messages(session, input_text, FORK_HISTORY_LIMIT))
+                    )
+
+                try:
+                    query_type = await self.classify_query(session, input_text)
+                except BaseException:
+                    if speculative:
+                        speculative.cancel()
+                    raise
+            logger.debug("Classified query type: %s", query_type)
+
+            # Information_Request, General_Greeting and any unexpected label go to the information agent
+            is_information = query_type != "Eligibility_Check"
+            recent_information_hits.append(is_information)
+
+            if is_information:
+                if speculative is None:
+                    response, status = await self.handle_information_request(session, input_text)
+                else:
+                    # Commit the speculative answer to the conversation thread
+                    response, status = await speculative
+                    await self._post_exchange(session, input_text, response)
+
+                self.record_turn(session, input_text, response)
+                await self.remember_information_response(input_text, query_type, response, status, first_turn)
+                return response
+
+            if speculative:
+                speculative.cancel()
+            response = await self.conduct_eligibility_assessment(session, input_text)
+            self.record_turn(session, input_text, response)
+            return response
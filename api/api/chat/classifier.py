@@ -0,0 +1,118 @@
+import re
+import logging
+from collections import Counter, OrderedDict
+from typing import TYPE_CHECKING, Optional, Sequence
+
+# numpy is only needed with the semantic_cache feature, so it is imported on first use
+if TYPE_CHECKING:
+    import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Bump to invalidate cached labels when the classifier agent's instructions change
+CLASSIFIER_VERSION = "v1"
+CLASSIFIER_CACHE_SIZE = 4096
+CLASSIFIER_LABELS = ("Information_Request", "Eligibility_Check", "General_Greeting")
+
+# (version, previous label, normalised text) -> label, in least recently used order
+classifier_cache: OrderedDict = OrderedDict()
+
+# Recent exchanges the direct classifier sees as conversation context
+CLASSIFIER_HISTORY_TURNS = 5
+
+# Questions at least this similar to a cached one, after the same previous label, reuse its label
+SEMANTIC_CACHE_SIZE = 1024
+SEMANTIC_CACHE_MIN_SIMILARITY = 0.92
+
+# (version, previous label, normalised text) -> (unit-length embedding, label), in least recently used order
+semantic_classifier_cache: OrderedDict = OrderedDict()
+
+# Messages that can be routed without asking the classifier agent
+POSTCODE_RE = re.compile(r"^[A-Z]{1,2}\d[A-Z\d]?\s*\d[A-Z]{2}$", re.I)
+GREETING_RE = re.compile(r"^(hi|hello|hey|thanks?|thank you|bye)( there| so much| very much)?[\s!.,]*$", re.I)
+
+# Words that point to one route when the other's words are absent
+ELIGIBILITY_KEYWORDS_RE = re.compile(r"\beligib", re.I)
+INFORMATION_KEYWORDS_RE = re.compile(r"\b(apply|applying|applications?|deadlines?|documents?)\b", re.I)
+
+# Speaker labels of the "User: ...\nAssistant: ..." transcripts the web client used to post
+TRANSCRIPT_USER_RE = re.compile(r"^User: ?", re.M)
+TRANSCRIPT_ASSISTANT_RE = re.compile(r"^Assistant: ?", re.M)
+
+# How each query was classified: "rule", "cache", "semantic" or "agent"
+classification_sources: Counter = Counter()
+
+def latest_user_message(text: str) -> str:
+    """The last user message of a transcript-shaped body, or the text unchanged if it isn't one"""
+    starts = list(TRANSCRIPT_USER_RE.finditer(text))
+    if not starts:
+        return text
+    latest = text[starts[-1].end():]
+    reply = TRANSCRIPT_ASSISTANT_RE.search(latest)
+    if reply:
+        latest = latest[:reply.start()]
+    return latest.strip()
+
+def rule_based_classify(input_text: str, previous_label: Optional[str] = None) -> Optional[str]:
+    """Classify unambiguous messages with regular expressions, or return None"""
+    # Only the latest user message counts; earlier replies mention every route's keywords
+    text = latest_user_message(input_text).strip()
+    if POSTCODE_RE.match(text):
+        # A bare postcode only makes sense as an answer to the eligibility check
+        return "Eligibility_Check"
+    if GREETING_RE.match(text):
+        return "General_Greeting"
+
+    # Replies to the eligibility agent's questions can mention anything, so leave those to the classifier
+    if previous_label != "Eligibility_Check":
+        eligibility = ELIGIBILITY_KEYWORDS_RE.search(text)
+        information = INFORMATION_KEYWORDS_RE.search(text)
+        if eligibility and not information:
+            return "Eligibility_Check"
+        if information and not eligibility:
+            return "Information_Request"
+    return None
+
+def record_classification_source(source: str) -> None:
+    classification_sources[source] += 1
+    if not logger.isEnabledFor(logging.DEBUG):
+        return
+    total = sum(classification_sources.values())
+    logger.debug(
+        "Classified by %s; rule %d/%d, cache %d/%d, semantic %d/%d, agent %d/%d", source,
+        classification_sources["rule"], total, classification_sources["cache"], total,
+        classification_sources["semantic"], total, classification_sources["agent"], total
+    )
+
+def unit_embedding(vector: Sequence[float]) -> Optional["np.ndarray"]:
+    """Scale an embedding to unit length, or return None if it has no direction to compare"""
+    import numpy as np
+
+    embedding = np.asarray(vector, dtype=np.float32)
+    norm = np.linalg.norm(embedding)
+    if not norm:
+        return None
+    return embedding / norm
+
+def semantic_cache_lookup(cache_key: tuple, embedding: "np.ndarray") -> Optional[str]:
+    """Return the label of the most similar cached question with the same version and previous label"""
+    import numpy as np
+
+    candidates = [(key, entry) for key, entry in semantic_classifier_cache.items() if key[:2] == cache_key[:2]]
+    if not candidates:
+        return None
+
+    # Embeddings are stored unit length, so the dot product is the cosine similarity
+    similarities = np.stack([cached for _, (cached, _) in candidates]) @ embedding
+    best = int(np.argmax(similarities))
+    if similarities[best] < SEMANTIC_CACHE_MIN_SIMILARITY:
+        return None
+
+    key, (_, label) = candidates[best]
+    semantic_classifier_cache.move_to_end(key)
+    return label
+
+def semantic_cache_store(cache_key: tuple, embedding: "np.ndarray", label: str) -> None:
+    semantic_classifier_cache[cache_key] = (embedding, label)
+    if len(semantic_classifier_cache) > SEMANTIC_CACHE_SIZE:
+        semantic_classifier_cache.popitem(last=False)
@@ -0,0 +1,113 @@
+import os
+import json
+import asyncio
+import hashlib
+from functools import lru_cache
+from typing import Dict, Optional, Tuple
+from urllib.parse import quote
+
+import orjson
+
+# Live distance service; the simulated schools below are used when it isn't configured
+DISTANCE_API_ENDPOINT = os.environ.get("DISTANCE_API_ENDPOINT")
+DISTANCE_API_KEY = os.environ.get("DISTANCE_API_KEY")
+DISTANCE_API_TIMEOUT = 5.0
+
+# Eligibility decision when the distance lookup finds no schools, so the agent has nothing left to weigh
+NO_SCHOOLS_REPLY = (
+    "This student is NOT ELIGIBLE for school transport, as no schools are within transport range of {postcode}. "
+    "If that postcode is wrong, please start a new eligibility check with the correct one."
+)
+
+DISTANCES_FILE_PATH = os.path.abspath(
+    os.path.join(os.path.dirname(__file__), "../../docs/distances.csv")
+)
+
+# Records the sha256 of the last uploaded distances.csv and the file ID Azure gave it
+DISTANCES_STATE_PATH = os.environ.get("DISTANCES_STATE_PATH", ".distances_file.json")
+
+# IDs of agents whose code interpreter file has been checked by this process
+distances_ready: set = set()
+distances_lock = asyncio.Lock()
+
+def file_sha256(path: str) -> str:
+    with open(path, "rb") as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+def load_distances_state() -> Dict:
+    try:
+        with open(DISTANCES_STATE_PATH) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+def save_distances_state(sha256: str, file_id: str) -> None:
+    with open(DISTANCES_STATE_PATH, "w") as f:
+        json.dump({"sha256": sha256, "file_id": file_id}, f)
+
+@lru_cache(maxsize=1)
+def get_distance_client():
+    """Return the process-wide pooled client for the distance service"""
+    import httpx
+
+    return httpx.AsyncClient(
+        base_url=DISTANCE_API_ENDPOINT,
+        headers={"Authorization": f"Bearer {DISTANCE_API_KEY}"} if DISTANCE_API_KEY else None,
+        limits=httpx.Limits(max_keepalive_connections=20, max_connections=50),
+        timeout=DISTANCE_API_TIMEOUT
+    )
+
+def distances_path(postcode: str) -> str:
+    """Distance service path for a normalised postcode, which may contain a space"""
+    return f"/distances/{quote(postcode, safe='')}"
+
+def normalise_postcode(postcode: str) -> str:
+    """Upper-case a postcode and collapse its whitespace so lookups match however it was typed"""
+    return " ".join(postcode.upper().split())
+
+# Simulated schools within transport range, by postcode area. Two-letter areas take
+# precedence over one-letter ones, so more areas only need adding here.
+SCHOOLS_BY_PREFIX: Dict[str, Tuple[str, ...]] = {
+    "E": ("East London High School", "St Peter's School"),
+    "SW": ("West London High School", "St Paul's School"),
+}
+
+def school_distances_body(schools: Tuple[str, ...]) -> str:
+    """Serialise everything in a get_school_distances result after its leading postcode field"""
+    return orjson.dumps({
+        "valid_schools_for_transport": schools,
+        "total_schools_found": len(schools),
+        "important_note": (
+            "These are the ONLY schools within transport range." if schools
+            else "No schools are within transport range for this postcode."
+        )
+    }).decode()[1:]
+
+# Postcode area -> serialised result minus the postcode, with "" for areas out of range
+SCHOOL_DISTANCE_BODIES = {prefix: school_distances_body(schools) for prefix, schools in SCHOOLS_BY_PREFIX.items()}
+SCHOOL_DISTANCE_BODIES[""] = school_distances_body(())
+
+def school_distances_json(postcode: str) -> str:
+    """Serialised get_school_distances result for a normalised postcode"""
+    body = SCHOOL_DISTANCE_BODIES.get(postcode[:2]) or SCHOOL_DISTANCE_BODIES.get(postcode[:1], SCHOOL_DISTANCE_BODIES[""])
+    return f'{{"postcode":{orjson.dumps(postcode).decode()},{body}'
+
+def no_schools_reply(tool_calls, tool_outputs) -> Optional[str]:
+    """Return the NOT ELIGIBLE reply if every tool call was a distance lookup that found no schools"""
+    postcodes = []
+    for tool_call, tool_output in zip(tool_calls, tool_outputs):
+        if tool_call.function.name != "get_school_distances":
+            return None
+        try:
+            result = orjson.loads(tool_output.output)
+        except orjson.JSONDecodeError:
+            return None
+
+        # Failed lookups carry no total, so they still go back to the agent
+        if not isinstance(result, dict) or result.get("total_schools_found") != 0:
+            return None
+        postcodes.append(result.get("postcode") or "this postcode")
+
+    if not postcodes:
+        return None
+    return NO_SCHOOLS_REPLY.format(postcode=" or ".join(postcodes))
@@ -0,0 +1,59 @@
+import os
+import time
+import sqlite3
+import asyncio
+import threading
+from typing import Optional, Tuple
+
+# Bump when the information agent's knowledge base or instructions change
+INFORMATION_CACHE_TAG = "info-v1"
+
+# Cached answers older than this are ignored and overwritten
+RESPONSE_CACHE_TTL = 7 * 24 * 60 * 60
+
+def normalise_question(text: str) -> str:
+    return " ".join(text.lower().split())
+
+class ResponseCache:
+    """On-disk cache of agent answers keyed on (tag, normalised question)"""
+
+    def __init__(self, path: str, tag: str = INFORMATION_CACHE_TAG, ttl: float = RESPONSE_CACHE_TTL) -> None:
+        self.tag = tag
+        self.ttl = ttl
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        with self.lock, self.connection:
+            self.connection.execute(
+                """CREATE TABLE IF NOT EXISTS responses (
+                    tag TEXT NOT NULL,
+                    question TEXT NOT NULL,
+                    label TEXT NOT NULL,
+                    response TEXT NOT NULL,
+                    created REAL NOT NULL,
+                    PRIMARY KEY (tag, question)
+                )"""
+            )
+
+    def _get(self, question: str) -> Optional[Tuple[str, str]]:
+        with self.lock:
+            row = self.connection.execute(
+                "SELECT label, response FROM responses WHERE tag = ? AND question = ? AND created > ?",
+                (self.tag, normalise_question(question), time.time() - self.ttl),
+            ).fetchone()
+        return row
+
+    def _set(self, question: str, label: str, response: str) -> None:
+        with self.lock, self.connection:
+            self.connection.execute(
+                "INSERT OR REPLACE INTO responses (tag, question, label, response, created) VALUES (?, ?, ?, ?, ?)",
+                (self.tag, normalise_question(question), label, response, time.time()),
+            )
+
+    async def get(self, question: str) -> Optional[Tuple[str, str]]:
+        """Return the cached (label, response) for a question, if any"""
+        return await asyncio.to_thread(self._get, question)
+
+    async def set(self, question: str, label: str, response: str) -> None:
+        await asyncio.to_thread(self._set, question, label, response)
+
+information_cache = ResponseCache(os.environ.get("RESPONSE_CACHE_PATH", ".council_cache.db"))
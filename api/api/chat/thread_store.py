@@ -0,0 +1,44 @@
+import time
+from typing import Dict, Tuple
+
+from api.chat.azure_clients import get_project
+from api.chat.chat_handler import AsyncChatHandler, Session, run_in_background
+
+# Idle time after which a session's thread is dropped and the next visit starts afresh
+THREAD_TTL = 60 * 60
+
+class ThreadStore:
+    """Keeps one conversation, and so one Azure thread, per user session"""
+
+    def __init__(self, handler: AsyncChatHandler, ttl: float = THREAD_TTL) -> None:
+        # Shared by every session; all per-user state lives on the Session
+        self.handler = handler
+        self.ttl = ttl
+
+        # Session ID -> (session, last used)
+        self.sessions: Dict[str, Tuple[Session, float]] = {}
+
+    def get_session(self, session_id: str) -> Session:
+        """Return the user's session, starting one if it is new or has expired"""
+        now = time.monotonic()
+        self.evict_expired(now)
+
+        entry = self.sessions.get(session_id)
+        if entry is None:
+            session = self.handler.new_session()
+        else:
+            session = entry[0]
+
+        self.sessions[session_id] = (session, now)
+        return session
+
+    def evict_expired(self, now: float) -> None:
+        """Forget sessions idle for longer than the TTL and delete their threads"""
+        expired = [
+            session_id for session_id, (_, last_used) in self.sessions.items()
+            if now - last_used > self.ttl
+        ]
+        for session_id in expired:
+            session, _ = self.sessions.pop(session_id)
+            if session.thread_id is not None:
+                run_in_background(get_project().agents.threads.delete(session.thread_id))
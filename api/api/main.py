@@ -1,30 +1,54 @@
 import os
-import tempfile
+import uuid
+import logging
+from contextlib import asynccontextmanager
 import dotenv
-from fastapi import FastAPI, HTTPException, UploadFile, WebSocket, Request
+from fastapi import Cookie, FastAPI, HTTPException, Response
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
 
-from api.chat.chat_handler import ChatHandler
+# Loaded before the api modules, which read their settings from the environment at import
+dotenv.load_dotenv()
+
+from api.chat.azure_clients import close_clients
+from api.chat.chat_handler import AsyncChatHandler
+from api.chat.classifier import latest_user_message
+from api.chat.thread_store import THREAD_TTL, ThreadStore
 # from api.enrich.translation import TranslationHandler
 # from api.enrich.audio_converter import AudioConverter
 # from api.enrich.audio_transcriber import AudioTranscriber
 # import azure.cognitiveservices.speech as speechsdk
 
-import json
-import re
+import orjson
 
-dotenv.load_dotenv()
+logging.basicConfig(level=os.environ.get("LOG_LEVEL", "INFO").upper())
+logger = logging.getLogger(__name__)
+
+# One handler for the whole app; one conversation thread per browser session
+chat_handler = AsyncChatHandler()
+thread_store = ThreadStore(chat_handler)
+
+SESSION_COOKIE = "session_id"
 
-app = FastAPI()
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Warms the shared Azure client and agents, and uploads distances.csv if it changed
+    await chat_handler.prepare()
+    yield
+    await close_clients()
 
-chat_handler = ChatHandler()
+app = FastAPI(lifespan=lifespan)
 
 class ProcessRequest(BaseModel):
+    # The new user message. Older clients posted the whole transcript, which is cut down to its last message.
     body: str
+    # Lets clients without cookies continue a conversation; takes precedence over the cookie
+    conversation_id: str | None = None
 
 
 class ProcessResponse(BaseModel):
     response: str
+    conversation_id: str
 
 """
 class AudioProcessResponse(BaseModel):
@@ -41,10 +65,63 @@ audio_transcriber = AudioTranscriber(speech_config)
 translation_handler = TranslationHandler()
 """
 
+CONVERSATION_HEADER = "X-Conversation-Id"
+
+def is_session_id(value: str) -> bool:
+    """Whether value has the form of an ID this app issues: a uuid4 as 32 lowercase hex digits"""
+    try:
+        parsed = uuid.UUID(hex=value)
+    except ValueError:
+        return False
+    return parsed.version == 4 and parsed.hex == value
+
+def resolve_session_id(request: ProcessRequest, session_id: str | None) -> str:
+    """The conversation to continue: the one the client names, the cookie's, or a new one"""
+    if request.conversation_id is not None:
+        if not is_session_id(request.conversation_id):
+            raise HTTPException(status_code=400, detail="conversation_id must be one returned by this API")
+        return request.conversation_id
+
+    # A malformed cookie is replaced rather than rejected, so the browser recovers on its own
+    if session_id is not None and is_session_id(session_id):
+        return session_id
+    return uuid.uuid4().hex
+
+def set_session_cookie(response: Response, session_id: str) -> None:
+    """Issue (or refresh) the cookie that ties the browser to its conversation thread"""
+    response.set_cookie(SESSION_COOKIE, session_id, max_age=THREAD_TTL, httponly=True, samesite="lax")
+
 @app.post("/api/process")
-async def process(request: ProcessRequest) -> ProcessResponse:
-    response_content = str(chat_handler.get_chat_response(request.body))
-    return ProcessResponse(response=response_content)
+async def process(request: ProcessRequest, response: Response, session_id: str | None = Cookie(default=None)) -> ProcessResponse:
+    session_id = resolve_session_id(request, session_id)
+    set_session_cookie(response, session_id)
+    session = thread_store.get_session(session_id)
+    try:
+        response_content = str(await chat_handler.aget_chat_response(session, latest_user_message(request.body)))
+    except TimeoutError as ex:
+        raise HTTPException(status_code=504, detail=str(ex))
+    return ProcessResponse(response=response_content, conversation_id=session_id)
+
+@app.post("/api/chat/stream")
+async def process_stream(request: ProcessRequest, session_id: str | None = Cookie(default=None)) -> StreamingResponse:
+    async def event_stream(session):
+        try:
+            async for chunk in chat_handler.stream_chat_response(session, latest_user_message(request.body)):
+                # JSON-encode each chunk so newlines in the reply don't break SSE framing
+                yield b"data: " + orjson.dumps(chunk) + b"\n\n"
+        except Exception as ex:
+            # The 200 status has already been sent, so report the failure as an error event
+            logger.exception("Streamed reply failed")
+            detail = str(ex) if isinstance(ex, TimeoutError) else "The reply could not be generated"
+            yield b"event: error\ndata: " + orjson.dumps(detail) + b"\n\n"
+
+    session_id = resolve_session_id(request, session_id)
+    session = thread_store.get_session(session_id)
+    response = StreamingResponse(
+        event_stream(session), media_type="text/event-stream", headers={CONVERSATION_HEADER: session_id}
+    )
+    set_session_cookie(response, session_id)
+    return response
 
 """
 @app.post(path="/api/process-audio-file")
@@ -60,7 +137,7 @@ async def process_audio_file(request: ProcessRequest) -> AudioProcessResponse:
 
         # Send to chat handler
         response_content = str(
-            chat_handler.get_chat_response(request.body+'\nUser: '+transcribed_audio)
+            await chat_handler.aget_chat_response(request.body+'\nUser: '+transcribed_audio)
         )
 
 
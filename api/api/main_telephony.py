@@ -1,12 +1,10 @@
 
-from pyexpat import model
 import uuid
 import os
 import sys
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
-from urllib.parse import urlencode, urljoin
+from urllib.parse import urlencode
 from azure.eventgrid import EventGridEvent, SystemEventNames
-import requests
 from quart import Quart, Response, request, json
 from logging import INFO
 import re
@@ -16,16 +14,18 @@ from azure.communication.callautomation import (
     RecognizeInputType,
     TextSource
     )
-from api.chat.chat_handler import ChatHandler
+
+# Load environment variables from .env file, before the api modules read them at import
+load_dotenv()
+
+from api.chat.azure_clients import close_clients, get_project
+from api.chat.chat_handler import AsyncChatHandler, Session, run_in_background
 
 from azure.communication.callautomation.aio import (
     CallAutomationClient
     )
 from azure.core.messaging import CloudEvent
 
-# Load environment variables from .env file
-load_dotenv()
-
 # Your ACS resource connection string
 ACS_CONNECTION_STRING = os.environ.get("AZURE_COMMUNICATION_CONNECTION_STRING")
 
@@ -78,14 +78,39 @@ max_retry = 2
 
 app = Quart(__name__)
 
-async def get_chat_completions_async(user_prompt): 
+# One handler for the whole app; each answered call gets its own session
+chat_handler = AsyncChatHandler()
+
+# Call connection ID -> the call's conversation, from answer until disconnect
+chat_sessions: dict[str, Session] = {}
+
+@app.before_serving
+async def prepare_chat_handler():
+    # Fetch the agents and run their one-off setup before the first call rather than during it
+    await chat_handler.prepare()
+
+@app.after_serving
+async def close_chat_clients():
+    await close_clients()
+
+async def get_chat_completions_async(user_prompt, call_connection_id): 
     global response_content
-    response_content = chat_handler.get_chat_response(user_prompt)
+    # A call answered before a restart has no session yet, so it starts one here
+    chat_session = chat_sessions.get(call_connection_id)
+    if chat_session is None:
+        chat_session = chat_sessions[call_connection_id] = chat_handler.new_session()
+    response_content = await chat_handler.aget_chat_response(chat_session, user_prompt)
     
     return response_content  
 
-async def get_chat_gpt_response(speech_input):
-   return await get_chat_completions_async(speech_input)
+async def get_chat_gpt_response(speech_input, call_connection_id):
+   return await get_chat_completions_async(speech_input, call_connection_id)
+
+def end_chat_session(call_connection_id):
+    # Forget the call's conversation and delete its thread
+    chat_session = chat_sessions.pop(call_connection_id, None)
+    if chat_session is not None and chat_session.thread_id is not None:
+        run_in_background(get_project().agents.threads.delete(chat_session.thread_id))
 
 async def handle_recognize(replyText,callerId,call_connection_id,context=""):
     play_source = TextSource(text=replyText, voice_name="en-US-NancyNeural")
@@ -131,12 +156,12 @@ def get_sentiment_score(sentiment_score):
     return int(match.group()) if match else -1
 
 async def answer_call_async(incoming_call_context,callback_url):
-    global chat_handler
-    chat_handler = ChatHandler()
-    return await call_automation_client.answer_call(
+    answer_call_result = await call_automation_client.answer_call(
         incoming_call_context=incoming_call_context,
         cognitive_services_endpoint=COGNITIVE_SERVICE_ENDPOINT,
         callback_url=callback_url)
+    chat_sessions[answer_call_result.call_connection_id] = chat_handler.new_session()
+    return answer_call_result
 
 @app.route("/api/incomingCall",  methods=['POST'])
 async def incoming_call_handler():
@@ -198,7 +223,7 @@ async def handle_callback(contextId):
                         if detect_escalate:
                             await handle_play(call_connection_id=event.data['callConnectionId'],text_to_play=END_CALL_PHRASE_TO_CONNECT_AGENT,context=CONNECT_AGENT_CONTEXT)
                         else:
-                            chat_gpt_response = await get_chat_gpt_response(speech_text)
+                            chat_gpt_response = await get_chat_gpt_response(speech_text, event.data['callConnectionId'])
                             app.logger.info(f"Chat GPT response:{chat_gpt_response}") 
                             regex = re.compile(CHAT_RESPONSE_EXTRACT_PATTERN)
                             match = regex.search(chat_gpt_response)
@@ -245,6 +270,10 @@ async def handle_callback(contextId):
                         await call_connection_client.transfer_call_to_participant(target_participant=transfer_destination)      
                         app.logger.info(f"Transfer call initiated: {context}")
 	
+            elif event.type == "Microsoft.Communication.CallDisconnected":
+                app.logger.info("Call disconnected for connection id: %s", event.data['callConnectionId'])
+                end_chat_session(event.data['callConnectionId'])
+
             elif event.type == "Microsoft.Communication.CallTransferAccepted":
                 app.logger.info(f"Call transfer accepted event received for connection id: {event.data['callConnectionId']}")   
              
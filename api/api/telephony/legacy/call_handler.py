@@ -1,7 +1,6 @@
 import os
 import json
-import asyncio
-import websockets
+import logging
 from fastapi import Request, WebSocket
 from azure.communication.callautomation import CallAutomationClient
 from azure.communication.callautomation.models import (
@@ -12,14 +11,16 @@ from azure.communication.callautomation.models import (
     AudioFormat
 )
 import azure.cognitiveservices.speech as speechsdk
-from api.chat.chat_handler import ChatHandler
+from api.chat.chat_handler import AsyncChatHandler
+
+logger = logging.getLogger(__name__)
 
 class TelephonyHandler:
     def __init__(self):
         self.call_client = CallAutomationClient.from_connection_string(
             os.environ["AZURE_COMMUNICATION_CONNECTION_STRING"]
         )
-        self.chat_handler = ChatHandler()
+        self.chat_handler = AsyncChatHandler()
         
         # Speech config
         self.speech_config = speechsdk.SpeechConfig(
@@ -34,6 +35,8 @@ class TelephonyHandler:
         
         if event_data.get("type") == "Microsoft.Communication.IncomingCall":
             incoming_call_context = event_data["data"]["incomingCallContext"]
+            await self.chat_handler.prepare()
+            self.chat_session = self.chat_handler.new_session()
             
             # Configure media streaming
             media_streaming_options = MediaStreamingOptions(
@@ -85,7 +88,7 @@ class TelephonyHandler:
                     await self._process_audio_chunk(audio_data, websocket, speech_synthesizer)
                     
         except Exception as e:
-            print(f"WebSocket error: {e}")
+            logger.error("WebSocket error: %s", e)
         finally:
             await websocket.close()
 
@@ -99,7 +102,7 @@ class TelephonyHandler:
         
         if recognized_text:
             # Get AI response using existing chat handler
-            ai_response = str(self.chat_handler.get_chat_response(recognized_text))
+            ai_response = str(await self.chat_handler.aget_chat_response(self.chat_session, recognized_text))
             
             # Convert response to audio
             result = speech_synthesizer.speak_text_async(ai_response).get()
@@ -1,23 +1,23 @@
 import os
+import logging
 from fastapi import Request
 from azure.communication.callautomation import CallAutomationClient
 from azure.communication.callautomation import (
     RecognizeInputType,
     TextSource,
-    SsmlSource,
-    VoiceKind,
-    FileSource
+    VoiceKind
 )
 import pyodbc
-import azure.cognitiveservices.speech as speechsdk
-from api.chat.chat_handler import ChatHandler
+from api.chat.chat_handler import AsyncChatHandler
+
+logger = logging.getLogger(__name__)
 
 class SimpleTelephonyHandler:
     def __init__(self):
         self.call_client = CallAutomationClient.from_connection_string(
             os.environ["AZURE_COMMUNICATION_CONNECTION_STRING"]
         )
-        self.chat_handler = ChatHandler()
+        self.chat_handler = AsyncChatHandler()
 
     async def handle_incoming_call(self, request: Request):
         """Handle incoming call webhook"""
@@ -56,6 +56,8 @@ class SimpleTelephonyHandler:
     async def _answer_call(self, event_data):
         """Answer incoming call"""
         incoming_call_context = event_data["data"]["incomingCallContext"]
+        await self.chat_handler.prepare()
+        self.chat_session = self.chat_handler.new_session()
 
         self.call_client.answer_call(
             incoming_call_context=incoming_call_context,
@@ -103,7 +105,7 @@ class SimpleTelephonyHandler:
             cursor.execute(query)
             name = cursor.fetchall()
 
-        print(f"Query result: {name}")
+        logger.debug("Query result: %s", name)
 
 
     async def _start_conversation(self, event_data):
@@ -125,10 +127,10 @@ class SimpleTelephonyHandler:
                 result = call_connection.play_media_to_all(
                     play_source=play_source
                 )
-                print(f"Play media result (TextSource GB): {result}")
+                logger.debug("Play media result (TextSource GB): %s", result)
                
-        except :
-                print(f"TextSource GB failed: {e2}")
+        except Exception as e2:
+                logger.warning("TextSource GB failed: %s", e2)
                 try:
                     # Approach 3: Basic TextSource without locale
                     play_source = TextSource(text=greeting)
@@ -136,10 +138,10 @@ class SimpleTelephonyHandler:
                     result = call_connection.play_media_to_all(
                         play_source=play_source
                     )
-                    print(f"Play media result (Basic): {result}")
+                    logger.debug("Play media result (Basic): %s", result)
                    
                 except Exception as e3:
-                    print(f"All playback approaches failed: {e3}")
+                    logger.error("All playback approaches failed: %s", e3)
  
     async def _continue_listening(self, event_data):
         """Start listening after greeting"""
@@ -162,7 +164,7 @@ class SimpleTelephonyHandler:
             recognized_text = recognition_result["speech"]
             
             # Get AI response
-            ai_response = str(self.chat_handler.get_chat_response(recognized_text))
+            ai_response = str(await self.chat_handler.aget_chat_response(self.chat_session, recognized_text))
             
             # Play response
             call_connection_id = event_data["data"]["callConnectionId"]
@@ -179,6 +181,6 @@ class SimpleTelephonyHandler:
                     play_source=play_source,
                     operation_context="ai_response"
                 )
-                print(f"Play AI response result: {result}")
+                logger.debug("Play AI response result: %s", result)
             except Exception as e:
-                print(f"Error playing AI response: {e}")
\ No newline at end of file
+                logger.error("Error playing AI response: %s", e)
\ No newline at end of file
@@ -0,0 +1,4 @@
+import os
+
+# Keep the module-level response cache out of the working directory while testing
+os.environ.setdefault("RESPONSE_CACHE_PATH", ":memory:")
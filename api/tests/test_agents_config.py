@@ -0,0 +1,33 @@
+import pytest
+
+from api.chat.agents_config import DEFAULT_AGENT_IDS, DEFAULT_FEATURES, AgentsConfig
+
+@pytest.fixture(autouse=True)
+def clean_env(monkeypatch):
+    monkeypatch.delenv("CHAT_FEATURES", raising=False)
+    for name in DEFAULT_AGENT_IDS:
+        monkeypatch.delenv(f"AZURE_AGENT_{name.upper()}_ID", raising=False)
+
+def test_defaults():
+    config = AgentsConfig.from_env()
+    assert config.agents == DEFAULT_AGENT_IDS
+    assert config.features == DEFAULT_FEATURES
+
+def test_agent_ids_can_be_overridden(monkeypatch):
+    monkeypatch.setenv("AZURE_AGENT_CLASSIFIER_ID", "asst_test")
+    config = AgentsConfig.from_env()
+    assert config.agents["classifier"] == "asst_test"
+    assert config.agents["information"] == DEFAULT_AGENT_IDS["information"]
+
+def test_features_are_read_comma_separated(monkeypatch):
+    monkeypatch.setenv("CHAT_FEATURES", " function_tools, semantic_cache ,")
+    assert AgentsConfig.from_env().features == {"function_tools", "semantic_cache"}
+
+def test_empty_features_disable_every_feature(monkeypatch):
+    monkeypatch.setenv("CHAT_FEATURES", "")
+    assert AgentsConfig.from_env().features == frozenset()
+
+def test_unknown_features_are_rejected(monkeypatch):
+    monkeypatch.setenv("CHAT_FEATURES", "code_interpreter,postcode")
+    with pytest.raises(ValueError, match="postcode"):
+        AgentsConfig.from_env()
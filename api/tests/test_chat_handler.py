@@ -0,0 +1,330 @@
+import asyncio
+from collections import deque
+from types import SimpleNamespace
+
+import pytest
+
+# The handler drives the Azure agents SDK, so it needs the SDKs to import
+pytest.importorskip("aiohttp")
+pytest.importorskip("azure.ai.agents")
+
+from azure.core.exceptions import HttpResponseError, ResourceNotFoundError
+from azure.ai.agents.models import (
+    MessageDelta, MessageDeltaChunk, MessageDeltaTextContent, MessageDeltaTextContentObject, ThreadRun
+)
+
+from api.chat import chat_handler
+from api.chat.agents_config import AgentsConfig
+from api.chat.chat_handler import AsyncChatHandler, Session, StreamedReply
+from api.chat.response_cache import ResponseCache
+
+def thread_run(status, run_id="run_1", thread_id="thread_1"):
+    return ThreadRun(id=run_id, thread_id=thread_id, status=status)
+
+def text_chunk(text):
+    return MessageDeltaChunk(id="msg_1", delta=MessageDelta(
+        role="assistant", content=[MessageDeltaTextContent(index=0, text=MessageDeltaTextContentObject(value=text))]
+    ))
+
+async def hang():
+    await asyncio.Event().wait()
+
+class FakeStream:
+    """Replays run stream events, then waits forever if told to hang"""
+
+    def __init__(self, events, then_hang=False):
+        self.events = list(events)
+        self.then_hang = then_hang
+        self.closed = False
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        self.closed = True
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        if self.events:
+            return self.events.pop(0)
+        if self.then_hang:
+            await hang()
+        raise StopAsyncIteration
+
+class FakeAgents:
+    """Just enough of project.agents to drive runs; tests replace the calls they care about"""
+
+    def __init__(self):
+        self.cancelled = []
+        self.created_threads = []
+        self.posted = []
+
+        async def create_thread(messages=None):
+            thread = SimpleNamespace(id=f"thread_{len(self.created_threads) + 1}", messages=messages or [])
+            self.created_threads.append(thread)
+            return thread
+
+        async def delete_thread(thread_id):
+            pass
+
+        async def create_message(thread_id, role, content):
+            self.posted.append((thread_id, role, content))
+
+        async def create_run(thread_id, agent_id, **options):
+            return thread_run("queued", thread_id=thread_id)
+
+        async def get_run(thread_id, run_id):
+            return thread_run("in_progress", run_id=run_id, thread_id=thread_id)
+
+        async def cancel_run(thread_id, run_id):
+            self.cancelled.append(run_id)
+            return thread_run("cancelled", run_id=run_id, thread_id=thread_id)
+
+        self.threads = SimpleNamespace(create=create_thread, delete=delete_thread)
+        self.messages = SimpleNamespace(create=create_message)
+        self.runs = SimpleNamespace(create=create_run, get=get_run, cancel=cancel_run)
+
+@pytest.fixture
+def agents(monkeypatch):
+    agents = FakeAgents()
+    monkeypatch.setattr(chat_handler, "get_project", lambda: SimpleNamespace(agents=agents))
+    return agents
+
+@pytest.fixture
+def handler():
+    handler = AsyncChatHandler(AgentsConfig(features=frozenset()))
+    handler.agent_classifier = SimpleNamespace(id="asst_classifier")
+    handler.agent_information = SimpleNamespace(id="asst_information")
+    handler.agent_eligibility_2 = SimpleNamespace(id="asst_eligibility")
+    return handler
+
+async def settle():
+    """Let fire-and-forget clean-up tasks run"""
+    for _ in range(5):
+        await asyncio.sleep(0)
+
+def test_run_with_timeout_cancels_a_run_that_overruns(agents, handler):
+    with pytest.raises(TimeoutError):
+        asyncio.run(handler._run_with_timeout("asst_information", thread_id="thread_1", timeout=0.05))
+    assert agents.cancelled == ["run_1"]
+
+def test_run_with_timeout_keeps_the_timeout_when_the_cancel_fails(agents, handler):
+    async def cancel_run(thread_id, run_id):
+        raise HttpResponseError("Cannot cancel run with status 'completed'")
+
+    agents.runs.cancel = cancel_run
+    with pytest.raises(TimeoutError):
+        asyncio.run(handler._run_with_timeout("asst_information", thread_id="thread_1", timeout=0.05))
+
+def test_run_with_timeout_returns_the_finished_run(agents, handler):
+    async def get_run(thread_id, run_id):
+        return thread_run("completed", run_id=run_id, thread_id=thread_id)
+
+    agents.runs.get = get_run
+    run = asyncio.run(handler._run_with_timeout("asst_information", thread_id="thread_1", timeout=1))
+    assert run.status == "completed"
+    assert agents.cancelled == []
+
+def test_discarded_runs_are_cancelled_in_the_background(agents, handler):
+    async def discard():
+        task = asyncio.create_task(handler._run_with_timeout("asst_information", thread_id="thread_1"))
+        await asyncio.sleep(0.01)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+        await settle()
+
+    asyncio.run(discard())
+    assert agents.cancelled == ["run_1"]
+
+def test_on_thread_starts_a_thread_on_first_use(agents, handler):
+    session = Session()
+
+    async def operation(thread_id):
+        return thread_id
+
+    assert asyncio.run(handler._on_thread(session, operation)) == "thread_1"
+    assert session.thread_id == "thread_1"
+
+def test_on_thread_starts_a_new_thread_when_azure_has_dropped_it(agents, handler):
+    session = Session(thread_id="thread_old", last_query_type="Eligibility_Check", turn_count=3)
+    session.history.append(("human", "hi"))
+    calls = []
+
+    async def operation(thread_id):
+        calls.append(thread_id)
+        if thread_id == "thread_old":
+            raise ResourceNotFoundError("No thread found with id 'thread_old'.")
+        return "ok"
+
+    assert asyncio.run(handler._on_thread(session, operation)) == "ok"
+    assert calls == ["thread_old", "thread_1"]
+    assert session.thread_id == "thread_1"
+    assert session.last_query_type is None
+    assert session.turn_count == 0
+    assert not session.history
+
+def test_on_thread_raises_other_missing_resources(agents, handler):
+    session = Session(thread_id="thread_1")
+
+    async def operation(thread_id):
+        raise ResourceNotFoundError("No run found with id 'run_1'.")
+
+    with pytest.raises(ResourceNotFoundError):
+        asyncio.run(handler._on_thread(session, operation))
+    assert agents.created_threads == []
+
+def stream_with(agents, stream):
+    async def start_stream(thread_id, agent_id, **options):
+        return stream
+
+    agents.runs.stream = start_stream
+
+async def read_stream(handler, reply, timeout=1.0):
+    return [chunk async for chunk in handler.stream_agent_response(Session(), "asst_information", reply, timeout=timeout)]
+
+def test_stream_records_the_reply_and_final_status(agents, handler):
+    stream_with(agents, FakeStream([
+        ("thread.run.created", thread_run("queued"), None),
+        ("thread.message.delta", text_chunk("Hello"), None),
+        ("thread.message.delta", text_chunk(" there"), None),
+        ("thread.run.completed", thread_run("completed"), None),
+    ]))
+    reply = StreamedReply()
+    assert asyncio.run(read_stream(handler, reply)) == ["Hello", " there"]
+    assert reply.chunks == ["Hello", " there"]
+    assert reply.status == "completed"
+
+def test_stream_cancels_a_run_that_overruns(agents, handler):
+    stream = FakeStream([("thread.run.created", thread_run("queued"), None)], then_hang=True)
+    stream_with(agents, stream)
+    reply = StreamedReply()
+    with pytest.raises(TimeoutError):
+        asyncio.run(read_stream(handler, reply, timeout=0.05))
+    assert agents.cancelled == ["run_1"]
+    assert stream.closed
+
+def test_stream_cancels_the_run_when_the_client_goes_away(agents, handler):
+    stream_with(agents, FakeStream([
+        ("thread.run.created", thread_run("queued"), None),
+        ("thread.message.delta", text_chunk("Hello"), None),
+    ], then_hang=True))
+
+    async def disconnect():
+        reply = StreamedReply()
+        chunks = handler.stream_agent_response(Session(), "asst_information", reply)
+        assert await chunks.__anext__() == "Hello"
+        await chunks.aclose()
+        await settle()
+
+    asyncio.run(disconnect())
+    assert agents.cancelled == ["run_1"]
+
+def test_misrouted_speculation_is_cancelled(agents, handler, monkeypatch):
+    monkeypatch.setattr(chat_handler, "recent_information_hits", deque(maxlen=chat_handler.SPECULATION_WINDOW))
+    speculation = SimpleNamespace(started=False, cancelled=False)
+
+    async def speculate(messages):
+        speculation.started = True
+        try:
+            await hang()
+        except asyncio.CancelledError:
+            speculation.cancelled = True
+            raise
+
+    async def classify(session, input_text):
+        await asyncio.sleep(0.01)
+        return "Eligibility_Check"
+
+    async def assess(session, input_text):
+        return "Eligible"
+
+    monkeypatch.setattr(handler, "speculate_information_request", speculate)
+    monkeypatch.setattr(handler, "classify_query", classify)
+    monkeypatch.setattr(handler, "conduct_eligibility_assessment", assess)
+
+    async def chat():
+        response = await handler.aget_chat_response(Session(), "My daughter starts secondary school in September")
+        await settle()
+        return response
+
+    assert asyncio.run(chat()) == "Eligible"
+    assert speculation.started and speculation.cancelled
+
+def test_cached_opening_answers_start_the_thread_in_one_call(agents, handler, monkeypatch, tmp_path):
+    cache = ResponseCache(str(tmp_path / "cache.db"))
+    asyncio.run(cache.set("How do I apply?", "Information_Request", "Online."))
+    monkeypatch.setattr(chat_handler, "information_cache", cache)
+
+    session = Session()
+    assert asyncio.run(handler.cached_information_response(session, "How do I apply?")) == "Online."
+    assert [thread.id for thread in agents.created_threads] == [session.thread_id]
+    assert [(m.role, m.content) for m in agents.created_threads[0].messages] == [
+        ("user", "How do I apply?"), ("assistant", "Online."),
+    ]
+    assert agents.posted == []
+    assert session.turn_count == 1
+    assert list(session.history) == [("human", "How do I apply?"), ("ai", "Online.")]
+
+@pytest.fixture
+def speculation_hits_information(handler, monkeypatch, tmp_path):
+    """Classify as an information request, recording the messages each speculative answer was given"""
+    monkeypatch.setattr(chat_handler, "recent_information_hits", deque(maxlen=chat_handler.SPECULATION_WINDOW))
+    monkeypatch.setattr(chat_handler, "information_cache", ResponseCache(str(tmp_path / "cache.db")))
+    seeds = []
+
+    async def speculate(messages):
+        seeds.append(messages)
+        return "Answer", "completed"
+
+    async def classify(session, input_text):
+        return "Information_Request"
+
+    monkeypatch.setattr(handler, "speculate_information_request", speculate)
+    monkeypatch.setattr(handler, "classify_query", classify)
+    return seeds
+
+def test_speculation_sees_the_fork_history_limit(agents, handler, speculation_hits_information):
+    session = Session(thread_id="thread_1", turn_count=12)
+    for turn in range(12):
+        session.history.append(("human", f"question {turn}"))
+        session.history.append(("ai", f"answer {turn}"))
+
+    assert asyncio.run(handler.aget_chat_response(session, "My daughter starts secondary school in September")) == "Answer"
+    seed, = speculation_hits_information
+    assert len(seed) == chat_handler.FORK_HISTORY_LIMIT + 1
+    assert seed[0].content == "question 2"
+    assert seed[-1].content == "My daughter starts secondary school in September"
+    assert [content for _, _, content in agents.posted] == ["My daughter starts secondary school in September", "Answer"]
+
+def test_first_speculative_answer_starts_the_thread_in_one_call(agents, handler, speculation_hits_information):
+    session = Session()
+    assert asyncio.run(handler.aget_chat_response(session, "My daughter starts secondary school in September")) == "Answer"
+    assert [thread.id for thread in agents.created_threads] == [session.thread_id]
+    assert [m.content for m in agents.created_threads[0].messages] == [
+        "My daughter starts secondary school in September", "Answer",
+    ]
+    assert agents.posted == []
+
+def test_streamed_eligibility_checks_run_to_completion(agents, handler, monkeypatch):
+    async def classify(session, input_text):
+        return "Eligibility_Check"
+
+    async def assess(session, input_text):
+        return "Eligible"
+
+    async def start_stream(thread_id, agent_id, **options):
+        raise AssertionError("eligibility runs stop for tool calls, so are not streamed")
+
+    monkeypatch.setattr(handler, "classify_query", classify)
+    monkeypatch.setattr(handler, "conduct_eligibility_assessment", assess)
+    agents.runs.stream = start_stream
+
+    async def chat(session):
+        return [chunk async for chunk in handler.stream_chat_response(session, "Is my son eligible? GU2 7XH")]
+
+    session = Session(thread_id="thread_1", turn_count=1)
+    assert asyncio.run(chat(session)) == ["Eligible"]
+    assert list(session.history) == [("human", "Is my son eligible? GU2 7XH"), ("ai", "Eligible")]
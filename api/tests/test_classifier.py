@@ -0,0 +1,70 @@
+import pytest
+
+from api.chat.classifier import latest_user_message, rule_based_classify
+
+@pytest.mark.parametrize("text", ["SW1A 1AA", "sw1a1aa", " E1 6AN "])
+def test_bare_postcode_is_an_eligibility_answer(text):
+    assert rule_based_classify(text) == "Eligibility_Check"
+
+@pytest.mark.parametrize("text", ["hi", "Hello there!", "thanks so much.", "Thank you", "bye"])
+def test_greetings(text):
+    assert rule_based_classify(text) == "General_Greeting"
+
+@pytest.mark.parametrize("text", [
+    "How do I apply?",
+    "When are applications due?",
+    "What documents do I need?",
+    "Is there a deadline?",
+])
+def test_information_keywords(text):
+    assert rule_based_classify(text) == "Information_Request"
+
+def test_eligibility_keywords():
+    assert rule_based_classify("Is my son eligible for a bus pass?") == "Eligibility_Check"
+
+def test_mixed_keywords_go_to_the_classifier():
+    assert rule_based_classify("What documents prove my child is eligible?") is None
+
+def test_replies_during_an_eligibility_check_go_to_the_classifier():
+    assert rule_based_classify("I sent the documents already", "Eligibility_Check") is None
+    assert rule_based_classify("SW1A 1AA", "Eligibility_Check") == "Eligibility_Check"
+
+def test_unrecognised_messages_go_to_the_classifier():
+    assert rule_based_classify("My daughter starts secondary school in September") is None
+
+def test_latest_user_message():
+    transcript = "User: hi\nAssistant: Hello! How can I help?\nUser: how do I\nget a bus pass?"
+    assert latest_user_message(transcript) == "how do I\nget a bus pass?"
+    assert latest_user_message("User: hi\nAssistant: Hello!") == "hi"
+    assert latest_user_message("how do I get a bus pass?") == "how do I get a bus pass?"
+
+@pytest.mark.parametrize("body, label", [
+    ("User: hi", "General_Greeting"),
+    ("User: SW1A 1AA", "Eligibility_Check"),
+    ("User: hi\nAssistant: Hello! I can check your eligibility for school transport.\nUser: how do I apply for a bus pass?",
+     "Information_Request"),
+])
+def test_transcript_bodies_are_classified_by_the_latest_user_message(body, label):
+    assert rule_based_classify(body, "General_Greeting") == label
+
+def test_assistant_replies_do_not_route_the_latest_message():
+    body = "User: hi\nAssistant: Hello! I can check your eligibility for school transport.\nUser: how do I get a bus pass?"
+    assert rule_based_classify(body, "General_Greeting") is None
+
+def test_zero_embeddings_skip_the_semantic_cache():
+    pytest.importorskip("numpy")
+    from api.chat.classifier import unit_embedding
+
+    assert unit_embedding([0.0, 0.0]) is None
+    assert unit_embedding([3.0, 4.0]).tolist() == pytest.approx([0.6, 0.8])
+
+def test_semantic_cache_matches_similar_questions_after_the_same_label():
+    pytest.importorskip("numpy")
+    from api.chat.classifier import semantic_cache_lookup, semantic_cache_store, semantic_classifier_cache, unit_embedding
+
+    semantic_classifier_cache.clear()
+    semantic_cache_store(("v1", None, "how do i apply"), unit_embedding([1.0, 0.0]), "Information_Request")
+    assert semantic_cache_lookup(("v1", None, "how can i apply"), unit_embedding([1.0, 0.01])) == "Information_Request"
+    assert semantic_cache_lookup(("v1", None, "am i eligible"), unit_embedding([0.0, 1.0])) is None
+    assert semantic_cache_lookup(("v1", "Eligibility_Check", "how can i apply"), unit_embedding([1.0, 0.01])) is None
+    semantic_classifier_cache.clear()
@@ -0,0 +1,67 @@
+from types import SimpleNamespace
+
+import orjson
+
+from api.chat.distances import SCHOOLS_BY_PREFIX, distances_path, no_schools_reply, normalise_postcode, school_distances_json
+
+def tool_call(name="get_school_distances"):
+    return SimpleNamespace(function=SimpleNamespace(name=name))
+
+def tool_output(output):
+    return SimpleNamespace(output=output)
+
+def test_school_distances_json_uses_the_two_letter_area_first():
+    result = orjson.loads(school_distances_json("SW1A 1AA"))
+    assert result == {
+        "postcode": "SW1A 1AA",
+        "valid_schools_for_transport": list(SCHOOLS_BY_PREFIX["SW"]),
+        "total_schools_found": 2,
+        "important_note": "These are the ONLY schools within transport range.",
+    }
+
+def test_school_distances_json_falls_back_to_the_one_letter_area():
+    result = orjson.loads(school_distances_json("E1 6AN"))
+    assert result["valid_schools_for_transport"] == list(SCHOOLS_BY_PREFIX["E"])
+    assert result["total_schools_found"] == 2
+
+def test_school_distances_json_reports_no_schools_out_of_range():
+    result = orjson.loads(school_distances_json("GU2 7XH"))
+    assert result["postcode"] == "GU2 7XH"
+    assert result["valid_schools_for_transport"] == []
+    assert result["total_schools_found"] == 0
+
+def test_school_distances_json_escapes_the_postcode():
+    assert orjson.loads(school_distances_json('GU"2'))["postcode"] == 'GU"2'
+
+def test_normalise_postcode():
+    assert normalise_postcode("  sw1a   1aa ") == "SW1A 1AA"
+
+def test_distances_path_quotes_the_postcode():
+    assert distances_path("SW1A 1AA") == "/distances/SW1A%201AA"
+    assert distances_path("../admin?x") == "/distances/..%2Fadmin%3Fx"
+
+def test_no_schools_reply_when_every_lookup_found_no_schools():
+    reply = no_schools_reply(
+        [tool_call(), tool_call()],
+        [tool_output(school_distances_json("GU2 7XH")), tool_output(school_distances_json("KT1 1AA"))]
+    )
+    assert "NOT ELIGIBLE" in reply
+    assert "GU2 7XH or KT1 1AA" in reply
+
+def test_no_schools_reply_leaves_schools_in_range_to_the_agent():
+    assert no_schools_reply(
+        [tool_call(), tool_call()],
+        [tool_output(school_distances_json("GU2 7XH")), tool_output(school_distances_json("E1 6AN"))]
+    ) is None
+
+def test_no_schools_reply_leaves_failed_lookups_to_the_agent():
+    failed = orjson.dumps({"postcode": "GU2 7XH", "error": "Distance lookup failed"}).decode()
+    assert no_schools_reply([tool_call()], [tool_output(failed)]) is None
+    assert no_schools_reply([tool_call()], [tool_output("not json")]) is None
+
+def test_no_schools_reply_leaves_other_tools_to_the_agent():
+    assert no_schools_reply(
+        [tool_call(), tool_call("other_tool")],
+        [tool_output(school_distances_json("GU2 7XH")), tool_output(school_distances_json("GU2 7XH"))]
+    ) is None
+    assert no_schools_reply([], []) is None
@@ -0,0 +1,28 @@
+import asyncio
+
+from api.chat import response_cache
+from api.chat.response_cache import ResponseCache, normalise_question
+
+def test_normalise_question():
+    assert normalise_question("  How do I\tAPPLY?\n") == "how do i apply?"
+
+def test_questions_match_however_they_are_typed(tmp_path):
+    cache = ResponseCache(str(tmp_path / "cache.db"))
+    asyncio.run(cache.set("How do I apply?", "Information_Request", "Online."))
+    assert asyncio.run(cache.get("  how do i   APPLY? ")) == ("Information_Request", "Online.")
+    assert asyncio.run(cache.get("How do I appeal?")) is None
+
+def test_answers_expire_after_the_ttl(tmp_path, monkeypatch):
+    cache = ResponseCache(str(tmp_path / "cache.db"), ttl=60)
+    monkeypatch.setattr(response_cache.time, "time", lambda: 1000.0)
+    asyncio.run(cache.set("How do I apply?", "Information_Request", "Online."))
+
+    monkeypatch.setattr(response_cache.time, "time", lambda: 1059.0)
+    assert asyncio.run(cache.get("How do I apply?")) is not None
+    monkeypatch.setattr(response_cache.time, "time", lambda: 1061.0)
+    assert asyncio.run(cache.get("How do I apply?")) is None
+
+def test_tags_keep_answers_apart(tmp_path):
+    path = str(tmp_path / "cache.db")
+    asyncio.run(ResponseCache(path, tag="info-v1").set("How do I apply?", "Information_Request", "Online."))
+    assert asyncio.run(ResponseCache(path, tag="info-v2").get("How do I apply?")) is None
@@ -0,0 +1,59 @@
+from types import SimpleNamespace
+
+import pytest
+
+# The store is built on the chat handler, which needs the Azure SDKs to import
+pytest.importorskip("aiohttp")
+pytest.importorskip("azure.ai.projects")
+
+from api.chat import thread_store
+from api.chat.agents_config import AgentsConfig
+from api.chat.chat_handler import AsyncChatHandler
+from api.chat.thread_store import ThreadStore
+
+@pytest.fixture
+def deleted_threads(monkeypatch):
+    deleted = []
+    threads = SimpleNamespace(delete=deleted.append)
+    monkeypatch.setattr(thread_store, "get_project", lambda: SimpleNamespace(agents=SimpleNamespace(threads=threads)))
+    monkeypatch.setattr(thread_store, "run_in_background", lambda result: None)
+    return deleted
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = SimpleNamespace(value=0.0)
+    monkeypatch.setattr(thread_store.time, "monotonic", lambda: now.value)
+    return now
+
+def test_sessions_are_kept_per_id(clock, deleted_threads):
+    store = ThreadStore(AsyncChatHandler(AgentsConfig()), ttl=60)
+    first = store.get_session("a")
+    assert store.get_session("a") is first
+    assert store.get_session("b") is not first
+
+def test_idle_sessions_are_evicted_and_their_threads_deleted(clock, deleted_threads):
+    store = ThreadStore(AsyncChatHandler(AgentsConfig()), ttl=60)
+    idle = store.get_session("idle")
+    idle.thread_id = "thread_idle"
+    never_used = store.get_session("never_used")
+
+    clock.value = 30.0
+    active = store.get_session("active")
+
+    clock.value = 61.0
+    assert store.get_session("active") is active
+    assert "idle" not in store.sessions
+    assert "never_used" not in store.sessions
+    # Sessions that never sent a message have no thread to delete
+    assert deleted_threads == ["thread_idle"]
+    assert store.get_session("idle") is not idle
+    assert never_used.thread_id is None
+
+def test_use_keeps_a_session_alive(clock, deleted_threads):
+    store = ThreadStore(AsyncChatHandler(AgentsConfig()), ttl=60)
+    session = store.get_session("a")
+    clock.value = 50.0
+    store.get_session("a")
+    clock.value = 100.0
+    assert store.get_session("a") is session
+    assert deleted_threads == []
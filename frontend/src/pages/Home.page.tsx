@@ -34,21 +34,72 @@ export function HomePage() {
     setLoading(false);
   };
 
-  const sendChatRequest = (endpoint: string, headers: any, body: any) => {
+  const appendToBotMessage = (chunk: string, first: boolean) => {
+    setMessages((oldMessages) => {
+      if (first) {
+        return [...oldMessages, { message: chunk, role: 'bot' }];
+      }
+      const last = oldMessages[oldMessages.length - 1];
+      return [...oldMessages.slice(0, -1), { ...last, message: last.message + chunk }];
+    });
+  };
+
+  const streamChatRequest = (endpoint: string, headers: any, body: any) => {
     fetch(endpoint, {
       method: 'POST',
       headers,
       body,
     })
       .then((response) => {
-        if (response.ok) {
-          return response.json();
+        if (!response.ok || !response.body) {
+          return Promise.reject(response);
         }
-        return Promise.reject(response);
-      })
-      .then((data) => {
-        setMessages((oldMessages) => [...oldMessages, { message: data.response, role: 'bot' }]);
-        setLoading(false);
+
+        // Server-sent events: each "data: <JSON string>" event is the next piece of the reply,
+        // and an "event: error" event carries the reason the reply stopped
+        const reader = response.body.pipeThrough(new TextDecoderStream()).getReader();
+        let buffer = '';
+        let started = false;
+        let failed = false;
+
+        const read = (): Promise<void> =>
+          reader.read().then(({ done, value }) => {
+            if (done) {
+              if (!started && !failed) {
+                return handleError(new Error('No reply was received'));
+              }
+              setLoading(false);
+              return undefined;
+            }
+
+            buffer += value;
+            const events = buffer.split('\n\n');
+            buffer = events.pop() ?? '';
+            events.forEach((event) => {
+              const lines = event.split('\n');
+              const data = lines.find((line) => line.startsWith('data: '));
+              if (!data) {
+                return;
+              }
+              const text = JSON.parse(data.slice('data: '.length));
+
+              if (lines.includes('event: error')) {
+                failed = true;
+                handleError(new Error(text));
+                return;
+              }
+
+              // Show the reply as soon as its first piece arrives
+              appendToBotMessage(text, !started);
+              if (!started) {
+                started = true;
+                setLoading(false);
+              }
+            });
+            return read();
+          });
+
+        return read();
       })
       .catch(async (error) => handleError(error));
   };
@@ -62,13 +113,14 @@ export function HomePage() {
     setMessages(updatedMessages);
     setLoading(true);
 
-    sendChatRequest(
-      '/api/process',
+    streamChatRequest(
+      '/api/chat/stream',
       {
         'Content-Type': 'application/json',
       },
+      // The session cookie ties the request to its conversation, so only the new message is sent
       JSON.stringify({ 
-        body: getConversationString(updatedMessages)
+        body: message
       })
     );
   };